@@ -1,5 +1,6 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Flask, render_template, request, send_file, jsonify, g, has_request_context
 from reportlab.pdfgen import canvas
+from reportlab.pdfgen.canvas import FILL_NON_ZERO
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
@@ -9,42 +10,248 @@ from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
 import tempfile
 import os
+import hashlib
+import struct
+import gzip
+import json
+import codecs
+import gc
+import mmap
+import sys
+from array import array
+from bisect import bisect_left
+import zipfile
 import random
 import re
+import threading
+import multiprocessing
+import time
+import sqlite3
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
 try:
-    import matplotlib
-    matplotlib.use('Agg')  # Non-interactive backend
-    import matplotlib.pyplot as plt
-    from io import BytesIO
-    from PIL import Image, ImageOps
-    LATEX_AVAILABLE = True
-    # Configure matplotlib for LaTeX
-    plt.rcParams['text.usetex'] = False  # Use matplotlib's mathtext, not external LaTeX
-    plt.rcParams['mathtext.fontset'] = 'cm'  # Computer Modern fonts
-    plt.rcParams['font.family'] = 'serif'
-except ImportError:
-    LATEX_AVAILABLE = False
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+from importlib.util import find_spec
+
+# The math stack (matplotlib, NumPy, PIL) is imported by load_math_stack()
+# on first use, so workers that only serve character sheets never pay for
+# it. Finding the packages is enough for the capability probe
+LATEX_AVAILABLE = all(find_spec(name) is not None for name in ('matplotlib', 'numpy', 'PIL'))
+# The batch problem generator only needs NumPy, not the rest of the stack
+NUMPY_AVAILABLE = find_spec('numpy') is not None
+_math_stack_loaded = False
+_math_stack_lock = threading.Lock()
+
+def load_numpy():
+    """
+    Import NumPy on first use by the batch problem generator
+    Returns whether NumPy is available
+    """
+    global NUMPY_AVAILABLE, np
+    if NUMPY_AVAILABLE and 'np' not in globals():
+        try:
+            import numpy as np
+        except ImportError as e:
+            print(f"NumPy unavailable: {e}")
+            NUMPY_AVAILABLE = False
+    return NUMPY_AVAILABLE
+
+def load_math_stack():
+    """
+    Import matplotlib, NumPy and PIL on first use by the math routes
+    Returns whether math rendering is available
+    """
+    global LATEX_AVAILABLE, _math_stack_loaded
+    global matplotlib, plt, FontProperties, get_font, MathTextParser, Path, TextToPath, np, Image, ImageOps
+    if _math_stack_loaded or not LATEX_AVAILABLE:
+        return LATEX_AVAILABLE
+    
+    with _math_stack_lock:
+        if _math_stack_loaded:
+            return LATEX_AVAILABLE
+        try:
+            import matplotlib
+            matplotlib.use('Agg')  # Non-interactive backend
+            import matplotlib.pyplot as plt
+            from matplotlib.font_manager import FontProperties, get_font
+            from matplotlib.mathtext import MathTextParser
+            from matplotlib.path import Path
+            from matplotlib.textpath import TextToPath
+            import numpy as np
+            from PIL import Image, ImageOps
+            # Configure matplotlib for LaTeX
+            plt.rcParams['text.usetex'] = False  # Use matplotlib's mathtext, not external LaTeX
+            plt.rcParams['mathtext.fontset'] = 'cm'  # Computer Modern fonts
+            plt.rcParams['font.family'] = 'serif'
+        except ImportError as e:
+            print(f"Math rendering unavailable: {e}")
+            LATEX_AVAILABLE = False
+        _math_stack_loaded = True
+    return LATEX_AVAILABLE
 
 app = Flask(__name__)
 
-def load_characters():
+class Metrics:
+    """
+    Process-local counters and latency histograms, exported in the
+    Prometheus text format by /metrics
+    Each worker process keeps its own values, as with any per-process
+    Prometheus client
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._local = threading.local()
+    
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+    
+    @staticmethod
+    def _key(metric, labels):
+        return metric, tuple(sorted((label, str(value)) for label, value in labels.items()))
+    
+    def inc(self, metric, amount=1, **labels):
+        key = self._key(metric, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def observe(self, metric, seconds, **labels):
+        key = self._key(metric, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+    
+    @property
+    def route(self):
+        """Route label for spans: the job override, else the request endpoint"""
+        route = getattr(self._local, 'route', None)
+        if route is None and has_request_context():
+            route = request.endpoint
+        return route or 'none'
+    
+    @contextmanager
+    def route_label(self, route):
+        """Label spans on this thread with route (background jobs have no request)"""
+        previous = getattr(self._local, 'route', None)
+        self._local.route = route
+        try:
+            yield
+        finally:
+            self._local.route = previous
+    
+    @contextmanager
+    def span(self, stage):
+        """Time a block into stage_duration_seconds{route, stage}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - start, route=self.route, stage=stage)
+    
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+    
+    def render(self, gauges=()):
+        """
+        Prometheus text exposition of everything recorded, plus gauges:
+        (name, kind, help, [(labels dict, value)]) computed at scrape time
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(buckets), total, count)
+                          for key, (buckets, total, count) in self._histograms.items()}
+        
+        families = {}
+        for (name, labels), value in sorted(counters.items()):
+            families.setdefault(name, []).append(f'{name}{self._labels(labels)} {value}')
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            lines = families.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(self.BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{self._labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{self._labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{self._labels(labels)} {total}')
+            lines.append(f'{name}_count{self._labels(labels)} {count}')
+        
+        output = []
+        for name in sorted(families):
+            kind, help_text = self._help.get(name, ('untyped', ''))
+            output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {kind}')
+            output.extend(families[name])
+        for name, kind, help_text, samples in gauges:
+            output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                output.append(f'{name}{self._labels(sorted(labels.items()))} {value}')
+        return '\n'.join(output) + '\n'
+
+metrics = Metrics()
+metrics.describe('http_request_duration_seconds', 'histogram', 'Request latency by route')
+metrics.describe('http_requests_total', 'counter', 'Requests by route, method and status')
+metrics.describe('stage_duration_seconds', 'histogram', 'Time spent in each generation stage by route')
+metrics.describe('math_render_failures_total', 'counter', 'Math renders that failed, by renderer')
+metrics.describe('math_render_pool_failures_total', 'counter', 'Times the render pool failed and rendering went serial')
+metrics.describe('cjk_font_fallback_sheets_total', 'counter', 'Character sheets drawn with the Helvetica fallback font')
+metrics.describe('character_draw_errors_total', 'counter', 'Characters replaced by a placeholder after a drawing error')
+metrics.describe('jobs_total', 'counter', 'Finished background jobs by kind and status')
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.endpoint or 'unknown'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                        route=route, method=request.method)
+        metrics.inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+    return response
+
+# 'raster' embeds a PNG per expression, 'vector' draws glyph outlines
+MATH_OUTPUT_MODE = os.environ.get('MATH_OUTPUT_MODE', 'raster')
+
+def _candidate_data_paths():
     # Use absolute path for PythonAnywhere deployment
-    import os
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_path = os.path.join(current_dir, 'data.txt')
     
     # Try multiple possible locations for PythonAnywhere deployment  
-    possible_paths = [
+    return [
         data_path,  # Same directory as app.py
         os.path.join(os.getcwd(), 'data.txt'),  # Current working directory
         '/home/{}/mysite/data.txt'.format(os.environ.get('USER', 'username')),  # Common PythonAnywhere path
         'data.txt'  # Relative path fallback
     ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                return f.read().strip()
+
+def _data_not_found_error(possible_paths):
+    current_dir = os.path.dirname(os.path.abspath(__file__))
     
     # If none found, provide detailed error message
     error_msg = f"data.txt not found in any of these locations:\n"
@@ -54,7 +261,350 @@ def load_characters():
     error_msg += f"App file location: {current_dir}\n"
     error_msg += f"Files in app directory: {os.listdir(current_dir) if os.path.exists(current_dir) else 'N/A'}"
     
-    raise FileNotFoundError(error_msg)
+    return FileNotFoundError(error_msg)
+
+class CharacterIndex(str):
+    """
+    Character database string with an O(1) char -> index lookup
+    Behaves like the plain data.txt string everywhere else (slicing, len, JSON)
+    """
+    def __new__(cls, chars, positions=None):
+        obj = super().__new__(cls, chars)
+        if positions is None:
+            positions = {}
+            for i, char in enumerate(obj):
+                # Keep the first occurrence, same as str.index()
+                positions.setdefault(char, i)
+        obj.positions = positions
+        return obj
+    
+    def _extended(self, more):
+        """
+        Return a new index with more appended, sharing this index's
+        positions dict so only the new characters are hashed
+        The string itself is still copied, so an append is O(total chars),
+        and the new snapshot's version hashes it all again on first use
+        Older snapshots ignore positions past their own length
+        Only the store calls this, on its latest snapshot
+        """
+        positions = self.positions
+        for i, char in enumerate(more, len(self)):
+            positions.setdefault(char, i)
+        return CharacterIndex(str(self) + more, positions)
+    
+    @property
+    def version(self):
+        """Content hash of this snapshot, computed once"""
+        version = self.__dict__.get('_version')
+        if version is None:
+            version = hashlib.sha1(self.encode('utf-8')).hexdigest()[:16]
+            self._version = version
+        return version
+    
+    def _position(self, char):
+        i = self.positions.get(char)
+        if i is None or i >= len(self):
+            return None
+        return i
+    
+    def __contains__(self, char):
+        if len(char) == 1:
+            return self._position(char) is not None
+        return str.__contains__(self, char)
+    
+    def index(self, char, *args):
+        if not args and len(char) == 1:
+            i = self._position(char)
+            if i is None:
+                raise ValueError("substring not found")
+            return i
+        return str.index(self, char, *args)
+
+class _MappedPositions:
+    """
+    char -> first index lookup by binary search over the sorted table of a
+    memory-mapped compiled database, so workers share its pages through the
+    OS cache instead of each building a dict
+    Characters appended after the table was built go to a small overlay dict
+    """
+    def __init__(self, codepoints, indices):
+        self._codepoints = codepoints
+        self._indices = indices
+        self._appended = {}
+    
+    def get(self, char, default=None):
+        i = self._appended.get(char)
+        if i is not None:
+            return i
+        cp = ord(char)
+        k = bisect_left(self._codepoints, cp)
+        if k < len(self._codepoints) and self._codepoints[k] == cp:
+            return self._indices[k]
+        return default
+    
+    def setdefault(self, char, i):
+        existing = self.get(char)
+        if existing is not None:
+            return existing
+        self._appended[char] = i
+        return i
+
+# Compiled database layout, all little-endian: header, then the code points
+# in database order, then the unique code points sorted, then the index of
+# each sorted code point's first occurrence
+_CHARACTER_DB_HEADER = struct.Struct('<4sIIIQQ')
+_CHARACTER_DB_MAGIC = b'CDB1'
+
+# '1' always keeps data.bin built, '0' never uses it, unset uses it only if
+# it already exists (created with `flask --app app compile-characters`)
+CHARACTER_DB_COMPILED = {'1': True, '0': False}.get(os.environ.get('CHARACTER_DB_COMPILED'))
+
+def compiled_db_path(text_path):
+    return os.path.splitext(text_path)[0] + '.bin'
+
+def write_character_db(db_path, chars, source_size, source_mtime_ns):
+    """
+    Atomically write the compiled form of chars to db_path
+    source_size/source_mtime_ns identify the data.txt it was built from
+    """
+    codepoints = array('I', map(ord, chars))
+    first = {}
+    for i, cp in enumerate(codepoints):
+        first.setdefault(cp, i)
+    sorted_codepoints = array('I', sorted(first))
+    indices = array('I', (first[cp] for cp in sorted_codepoints))
+    if sys.byteorder == 'big':
+        for values in (codepoints, sorted_codepoints, indices):
+            values.byteswap()
+    
+    header = _CHARACTER_DB_HEADER.pack(_CHARACTER_DB_MAGIC, len(codepoints), len(sorted_codepoints), 0,
+                                       source_size, source_mtime_ns)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(db_path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(codepoints.tobytes())
+            f.write(sorted_codepoints.tobytes())
+            f.write(indices.tobytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, db_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def compile_character_db(text_path, db_path=None):
+    """Convert data.txt into the compiled format; returns the output path"""
+    db_path = db_path or compiled_db_path(text_path)
+    st = os.stat(text_path)
+    with open(text_path, 'rb') as f:
+        data = f.read()
+    write_character_db(db_path, data.decode('utf-8').strip(), len(data), st.st_mtime_ns)
+    return db_path
+
+def load_character_db(db_path, source_size=None, source_mtime_ns=None):
+    """
+    Memory-map a compiled database and return it as a CharacterIndex
+    The characters are copied into the returned str (a UTF-32 decode, not
+    UTF-8); only the sorted lookup table stays mapped and shared
+    Returns None when the file is missing, malformed, or was built from a
+    different data.txt than the given size/mtime
+    """
+    if sys.byteorder != 'little':
+        return None
+    try:
+        with open(db_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    
+    if len(mapped) < _CHARACTER_DB_HEADER.size:
+        return None
+    magic, count, unique, _, size, mtime_ns = _CHARACTER_DB_HEADER.unpack_from(mapped)
+    if magic != _CHARACTER_DB_MAGIC or len(mapped) != _CHARACTER_DB_HEADER.size + 4 * (count + 2 * unique):
+        return None
+    if source_size is not None and (size, mtime_ns) != (source_size, source_mtime_ns):
+        return None
+    
+    view = memoryview(mapped)[_CHARACTER_DB_HEADER.size:]
+    chars = str(view[:4 * count], 'utf-32-le')
+    tables = view[4 * count:].cast('I')
+    return CharacterIndex(chars, _MappedPositions(tables[:unique], tables[unique:]))
+
+@contextmanager
+def _exclusive_file_lock(path):
+    """Inter-process exclusive lock held on path; thread-only where fcntl is missing"""
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _trailing_whitespace(path, size):
+    """Whitespace at the end of the first size bytes of path, which a full load strips"""
+    window = 64
+    with open(path, 'rb') as f:
+        while True:
+            start = max(0, size - window)
+            f.seek(start)
+            # A character cut at the window start is dropped; it can only matter
+            # when everything after it is whitespace, and then the window grows
+            text = f.read(size - start).decode('utf-8', errors='ignore')
+            body = text.rstrip()
+            if body or start == 0:
+                return text[len(body):]
+            window *= 4
+
+class CharacterStore:
+    """
+    Process-resident character database
+    Reloads data.txt only when its mtime or size changes, and stats the file
+    at most once per check_interval seconds
+    data.txt is append-only: when it grows, only the new bytes are read,
+    decoded and indexed, though building the new snapshot string still
+    copies the whole database (see CharacterIndex._extended)
+    Full loads go through the compiled data.bin when enabled (see
+    CHARACTER_DB_COMPILED), rebuilding it first if data.txt has changed
+    """
+    def __init__(self, path=None, check_interval=1.0, compiled=None):
+        self.path = path
+        self.check_interval = check_interval
+        self.compiled = CHARACTER_DB_COMPILED if compiled is None else compiled
+        self._lock = threading.Lock()
+        self._chars = None
+        self._stamp = None
+        self._size = 0
+        self._pending = ''
+        self._checked_at = None
+    
+    def resolve_path(self):
+        if self.path:
+            if not os.path.exists(self.path):
+                raise _data_not_found_error([self.path])
+            return self.path
+        possible_paths = _candidate_data_paths()
+        for path in possible_paths:
+            if os.path.exists(path):
+                return path
+        raise _data_not_found_error(possible_paths)
+    
+    def _is_fresh(self, now):
+        return self._checked_at is not None and now - self._checked_at < self.check_interval
+    
+    def _refresh_locked(self, path):
+        """Bring the index up to date with data.txt; caller holds self._lock"""
+        st = os.stat(path)
+        if (path, st.st_ino, st.st_mtime_ns, st.st_size) == self._stamp:
+            return self._chars
+        
+        appended = (self._stamp is not None and self._stamp[:2] == (path, st.st_ino)
+                    and st.st_size > self._size)
+        if appended:
+            with open(path, 'rb') as f:
+                f.seek(self._size)
+                tail = f.read(st.st_size - self._size)
+            # Leave an incomplete trailing UTF-8 sequence for the next refresh
+            text = codecs.getincrementaldecoder('utf-8')().decode(tail, final=False)
+            self._size += len(text.encode('utf-8'))
+            self._chars = self._extended_locked(text)
+        else:
+            self._size, self._chars = self._load_full(path, st)
+            self._pending = _trailing_whitespace(path, self._size)
+        
+        self._stamp = (path, st.st_ino, st.st_mtime_ns, self._size)
+        return self._chars
+    
+    def _extended_locked(self, text):
+        """
+        Append decoded text the way a full load would index it: data.txt is
+        stripped only at its ends, so trailing whitespace is held back until
+        more text follows it; caller holds self._lock
+        """
+        text = self._pending + text
+        if not self._chars:
+            text = text.lstrip()
+        body = text.rstrip()
+        self._pending = text[len(body):]
+        return self._chars._extended(body)
+    
+    def _load_full(self, path, st):
+        """Return (size, CharacterIndex) for the whole of data.txt"""
+        db_path = compiled_db_path(path)
+        use_compiled = self.compiled if self.compiled is not None else os.path.exists(db_path)
+        if use_compiled:
+            chars = load_character_db(db_path, st.st_size, st.st_mtime_ns)
+            if chars is not None:
+                return st.st_size, chars
+        
+        with open(path, 'rb') as f:
+            data = f.read()
+        text = data.decode('utf-8').strip()
+        
+        if use_compiled:
+            try:
+                write_character_db(db_path, text, len(data), st.st_mtime_ns)
+                chars = load_character_db(db_path, len(data), st.st_mtime_ns)
+                if chars is not None:
+                    return len(data), chars
+            except OSError as e:
+                print(f"Could not rebuild {db_path}: {e}")
+        
+        return len(data), CharacterIndex(text)
+    
+    def get(self):
+        """Return the current CharacterIndex, reloading if data.txt changed"""
+        now = time.monotonic()
+        if self._is_fresh(now):
+            return self._chars
+        
+        with self._lock:
+            if self._is_fresh(now):
+                return self._chars
+            self._refresh_locked(self.resolve_path())
+            self._checked_at = now
+            return self._chars
+    
+    def append(self, chars):
+        """
+        Append the characters not already in the database
+        Serialized across threads and worker processes by an exclusive lock
+        on data.txt.lock, and written with a single O_APPEND write
+        Returns [(char, index)] for the characters that were added
+        """
+        path = self.resolve_path()
+        with self._lock, _exclusive_file_lock(path + '.lock'):
+            # Pick up appends made by other workers before checking membership
+            current = self._refresh_locked(path)
+            new_chars = [char for char in dict.fromkeys(chars) if char not in current]
+            if not new_chars:
+                return []
+            
+            data = ''.join(new_chars).encode('utf-8')
+            with open(path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                st = os.fstat(f.fileno())
+            
+            self._chars = self._extended_locked(''.join(new_chars))
+            self._size += len(data)
+            self._stamp = (path, st.st_ino, st.st_mtime_ns, self._size)
+            self._checked_at = time.monotonic()
+            return [(char, self._chars.index(char)) for char in new_chars]
+    
+    def invalidate(self):
+        """Force the next get() to re-check data.txt"""
+        with self._lock:
+            self._stamp = None
+            self._checked_at = None
+
+character_store = CharacterStore()
+
+def load_characters():
+    """Return the character database from the process-resident store"""
+    return character_store.get()
 
 def select_characters(new_chars, start_char, all_chars):
     """
@@ -68,6 +618,9 @@ def select_characters(new_chars, start_char, all_chars):
     if num_old <= 0:
         return new_char_list[:50]
     
+    if not isinstance(all_chars, CharacterIndex):
+        all_chars = CharacterIndex(all_chars)
+    
     # Validate all new chars are in data
     new_char_indices = []
     for char in new_char_list:
@@ -87,6 +640,7 @@ def select_characters(new_chars, start_char, all_chars):
         raise ValueError(f"Review starting character '{start_char}' not found in data.txt")
     
     start_index = all_chars.index(start_char)
+    new_char_index_set = set(new_char_indices)
     
     # Validate start index < min new index
     if start_index >= min_new_index:
@@ -98,7 +652,7 @@ def select_characters(new_chars, start_char, all_chars):
     
     while len(old_chars) < num_old:
         # Skip if current index is a new character index
-        if current_index not in new_char_indices:
+        if current_index not in new_char_index_set:
             old_chars.append(all_chars[current_index])
         
         # Move to previous index, wrap around if needed
@@ -112,6 +666,56 @@ def select_characters(new_chars, start_char, all_chars):
     
     return new_char_list + old_chars[:num_old]
 
+def next_review_start(new_chars, start_char, all_chars):
+    """
+    Return the review starting character for the sheet after this one
+    Sheets with 50+ new characters use no review, so the start is unchanged
+    """
+    num_old = 50 - len(new_chars)
+    if num_old <= 0:
+        return start_char
+    
+    if not isinstance(all_chars, CharacterIndex):
+        all_chars = CharacterIndex(all_chars)
+    
+    # Find the starting index
+    start_index = all_chars.index(start_char)
+    
+    # Calculate how many review characters we collected
+    # We go backward from start_index, collecting num_old characters
+    # The last character we collect is at index: start_index - (num_old - 1)
+    # So the next starting point is: start_index - num_old
+    
+    next_start_index = start_index - num_old
+    
+    # Handle wraparound case
+    if next_start_index < 0:
+        next_start_index = len(all_chars) + next_start_index
+    
+    return all_chars[next_start_index]
+
+def suggest_review_start(new_chars, all_chars):
+    """
+    Suggest a review starting character that satisfies select_characters:
+    the character just before the earliest new character, so review covers
+    the most recently learned ones. Returns None when no review is needed
+    and raises ValueError when the new characters themselves are invalid
+    """
+    if 50 - len(new_chars) <= 0:
+        return None
+    
+    if not isinstance(all_chars, CharacterIndex):
+        all_chars = CharacterIndex(all_chars)
+    
+    for char in new_chars:
+        if char not in all_chars:
+            raise ValueError(f"New character '{char}' not found in data.txt")
+    
+    start_char = all_chars[min(all_chars.index(char) for char in new_chars) - 1]
+    # Run the real selection so any remaining rule violation surfaces here
+    select_characters(new_chars, start_char, all_chars)
+    return start_char
+
 def generate_smart_filename(new_chars, start_char, all_chars):
     """
     Generate filename in format: new_chars(下一个next_char).pdf
@@ -125,21 +729,7 @@ def generate_smart_filename(new_chars, start_char, all_chars):
             # Only new characters, no review - use simple filename
             return f'{new_chars}.pdf'
         
-        # Find the starting index
-        start_index = all_chars.index(start_char)
-        
-        # Calculate how many review characters we collected
-        # We go backward from start_index, collecting num_old characters
-        # The last character we collect is at index: start_index - (num_old - 1)
-        # So the next starting point is: start_index - num_old
-        
-        next_start_index = start_index - num_old
-        
-        # Handle wraparound case
-        if next_start_index < 0:
-            next_start_index = len(all_chars) + next_start_index
-        
-        next_start_char = all_chars[next_start_index]
+        next_start_char = next_review_start(new_chars, start_char, all_chars)
         
         # Generate filename
         filename = f'{new_chars}(下一个{next_start_char}).pdf'
@@ -149,36 +739,71 @@ def generate_smart_filename(new_chars, start_char, all_chars):
         # Fallback to simple filename if anything goes wrong
         return f'{new_chars}.pdf'
 
-def filter_chinese_characters(text):
+# Chinese character Unicode ranges, as inclusive (first, last) code points
+CJK_RANGES = (
+    (0x4E00, 0x9FFF),    # CJK Unified Ideographs (most common Chinese characters)
+    (0x3400, 0x4DBF),    # CJK Extension A
+    (0xF900, 0xFAFF),    # CJK Compatibility Ideographs
+    (0x20000, 0x2EE5F),  # CJK Extensions B-F and I (supplementary plane)
+    (0x2F800, 0x2FA1F),  # CJK Compatibility Ideographs Supplement
+    (0x30000, 0x323AF),  # CJK Extensions G-H
+)
+
+@lru_cache(maxsize=16)
+def _ranges_pattern(ranges):
+    """Compiled character class matching any code point in ranges"""
+    return re.compile('[' + ''.join(f'{re.escape(chr(first))}-{re.escape(chr(last))}'
+                                    for first, last in ranges) + ']')
+
+def filter_chinese_characters(text, ranges=CJK_RANGES, limit=None, chunk_size=1 << 16):
     """
     Filter out only Chinese characters from text and remove duplicates
-    Returns a string of unique Chinese characters
+    Returns a string of unique Chinese characters in order of first appearance
+    text may be a string or an iterable of string chunks (e.g. a decoded
+    stream). Stops reading once limit unique characters have been found
     """
-    # Chinese character Unicode ranges:
-    # \u4e00-\u9fff: CJK Unified Ideographs (most common Chinese characters)
-    # \u3400-\u4dbf: CJK Extension A
-    # \uf900-\ufaff: CJK Compatibility Ideographs
-    chinese_pattern = r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff]'
-    
-    # Find all Chinese characters
-    chinese_chars = re.findall(chinese_pattern, text)
-    
-    # Remove duplicates while preserving order
-    unique_chars = []
-    seen = set()
-    for char in chinese_chars:
-        if char not in seen:
-            unique_chars.append(char)
-            seen.add(char)
-    
-    return ''.join(unique_chars)
+    chunks = (text,) if isinstance(text, str) else text
+    pattern = _ranges_pattern(tuple(ranges))
+    unique = {}
+    # Nothing has been seen before the first part, so probing it can't skip it
+    probe = False
+    
+    for chunk in chunks:
+        for start in range(0, len(chunk), chunk_size):
+            part = chunk[start:start + chunk_size]
+            found = None
+            if probe:
+                # Set operations run in C; parts with no unseen Chinese
+                # character are skipped without matching or ordering them
+                new = set(part)
+                new.difference_update(unique)
+                new = pattern.findall(''.join(new))
+                if not new:
+                    continue
+                if len(new) <= 32:
+                    # A handful of find() scans beats ordering the whole part
+                    found = dict.fromkeys(sorted(new, key=part.find))
+            if found is None:
+                # findall and dict.fromkeys are linear passes in C that keep
+                # the order of first appearance within this part
+                found = dict.fromkeys(pattern.findall(part))
+            before = len(unique)
+            if limit is None:
+                unique.update(found)
+            else:
+                for char in found:
+                    if char not in unique:
+                        unique[char] = None
+                        if len(unique) >= limit:
+                            return ''.join(unique)
+            # Text dense with new characters (e.g. a pasted character list)
+            # would pay for the probe on every part without ever skipping one
+            probe = len(unique) - before < len(part) // 16
+    
+    return ''.join(unique)
 
-def generate_exponential_problem(difficulty):
-    """
-    Generate a single exponential math problem based on difficulty level
-    Returns a tuple: (problem_text, answer_text)
-    """
-    # Set ranges based on difficulty
+def _difficulty_settings(difficulty):
+    """Return (base_range, exp_range, allow_negative, problem_types) for a difficulty"""
     if difficulty == 'easy':
         base_range = (2, 9)
         exp_range = (1, 5)
@@ -194,24 +819,32 @@ def generate_exponential_problem(difficulty):
         exp_range = (1, 8)   # Smaller exponents for readability
         allow_negative = True
         problem_types = ['product', 'quotient', 'power', 'negative', 'multi_part', 'fraction_mix']
-    
-    problem_type = random.choice(problem_types)
+    return base_range, exp_range, allow_negative, problem_types
+
+def generate_exponential_problem(difficulty, rng=random):
+    """
+    Generate a single exponential math problem based on difficulty level
+    rng is the request's random.Random (defaults to the random module)
+    Returns a tuple: (problem_text, answer_text)
+    """
+    base_range, exp_range, allow_negative, problem_types = _difficulty_settings(difficulty)
+    problem_type = rng.choice(problem_types)
     
     if problem_type == 'multi_part' and difficulty == 'hard':
         # Generate complex 3+ part problems for hard difficulty
-        return generate_multi_part_problem(base_range, exp_range)
+        return generate_multi_part_problem(base_range, exp_range, rng)
     elif problem_type == 'fraction_mix' and difficulty == 'hard':
         # Generate fraction notation mixed with negative exponents
-        return generate_fraction_mix_problem(base_range, exp_range)
+        return generate_fraction_mix_problem(base_range, exp_range, rng)
     else:
         # Standard 2-part problems (works for all difficulties)
-        return generate_standard_problem(problem_type, base_range, exp_range, allow_negative)
+        return generate_standard_problem(problem_type, base_range, exp_range, allow_negative, rng)
 
-def generate_multi_part_problem(base_range, exp_range):
+def generate_multi_part_problem(base_range, exp_range, rng=random):
     """
     Generate complex multi-part problems like: a^m × (a^n)^p ÷ a^q
     """
-    base = random.randint(*base_range)
+    base = rng.randint(*base_range)
     num_parts = 3  # Limit to 3 parts to prevent clipping
     
     # Generate different operation combinations
@@ -225,14 +858,14 @@ def generate_multi_part_problem(base_range, exp_range):
         ['power', 'product', 'quotient', 'power'],    # (a^m)^n × a^p ÷ (a^q)^r
     ]
     
-    pattern = random.choice(patterns[:3])  # Only use 3-part patterns
+    pattern = rng.choice(patterns[:3])  # Only use 3-part patterns
     
     # Generate exponents
-    exponents = [random.randint(*exp_range) for _ in range(num_parts)]
+    exponents = [rng.randint(*exp_range) for _ in range(num_parts)]
     
     # Add some negative exponents
     for i in range(len(exponents)):
-        if random.random() < 0.3:
+        if rng.random() < 0.3:
             exponents[i] = -exponents[i]
     
     # Build problem string and calculate answer
@@ -243,11 +876,11 @@ def generate_multi_part_problem(base_range, exp_range):
     for i, (op, exp) in enumerate(zip(pattern, exponents)):
         if op == 'power':
             if i == 0:
-                power_exp = random.randint(2, 4)
+                power_exp = rng.randint(2, 4)
                 parts.append(f"({base}^{{{exp}}})^{{{power_exp}}}")
                 running_exponent += exp * power_exp
             else:
-                power_exp = random.randint(2, 3)
+                power_exp = rng.randint(2, 3)
                 parts.append(f"({base}^{{{exp}}})^{{{power_exp}}}")
                 if operations[-1] == '×':
                     running_exponent += exp * power_exp
@@ -278,11 +911,11 @@ def generate_multi_part_problem(base_range, exp_range):
     answer = f"{base}^{{{running_exponent}}}"
     return problem, answer
 
-def generate_fraction_mix_problem(base_range, exp_range):
+def generate_fraction_mix_problem(base_range, exp_range, rng=random):
     """
     Generate problems mixing fractions and negative exponents like: (1/a)^n × a^(-m)
     """
-    base = random.randint(*base_range)
+    base = rng.randint(*base_range)
     
     # Different fraction mix patterns
     patterns = [
@@ -293,98 +926,98 @@ def generate_fraction_mix_problem(base_range, exp_range):
         'complex_fraction_mix'        # (1/a)^n × a^m ÷ a^(-p)
     ]
     
-    pattern = random.choice(patterns)
+    pattern = rng.choice(patterns)
     
     if pattern == 'fraction_times_negative':
         # (1/a)^n × a^(-m) = a^(-n) × a^(-m) = a^(-n-m)
-        exp1 = random.randint(1, exp_range[1])
-        exp2 = random.randint(1, exp_range[1])
+        exp1 = rng.randint(1, exp_range[1])
+        exp2 = rng.randint(1, exp_range[1])
         problem = f"(1/{base})^{{{exp1}}} × {base}^{{-{exp2}}}"
         answer = f"{base}^{{-{exp1 + exp2}}}"
         
     elif pattern == 'fraction_times_positive':
         # (1/a)^n × a^m = a^(-n) × a^m = a^(m-n)
-        exp1 = random.randint(1, exp_range[1])
-        exp2 = random.randint(1, exp_range[1])
+        exp1 = rng.randint(1, exp_range[1])
+        exp2 = rng.randint(1, exp_range[1])
         problem = f"(1/{base})^{{{exp1}}} × {base}^{{{exp2}}}"
         result_exp = exp2 - exp1
         answer = f"{base}^{{{result_exp}}}"
         
     elif pattern == 'fraction_divide_negative':
         # (1/a)^n ÷ a^(-m) = a^(-n) ÷ a^(-m) = a^(-n+m) = a^(m-n)
-        exp1 = random.randint(1, exp_range[1])
-        exp2 = random.randint(1, exp_range[1])
+        exp1 = rng.randint(1, exp_range[1])
+        exp2 = rng.randint(1, exp_range[1])
         problem = f"(1/{base})^{{{exp1}}} ÷ {base}^{{-{exp2}}}"
         result_exp = exp2 - exp1
         answer = f"{base}^{{{result_exp}}}"
         
     elif pattern == 'power_of_fraction':
         # ((1/a)^n)^m = (a^(-n))^m = a^(-n×m)
-        exp1 = random.randint(1, exp_range[1])
-        exp2 = random.randint(2, 4)
+        exp1 = rng.randint(1, exp_range[1])
+        exp2 = rng.randint(2, 4)
         problem = f"((1/{base})^{{{exp1}}})^{{{exp2}}}"
         answer = f"{base}^{{-{exp1 * exp2}}}"
         
     else:  # complex_fraction_mix
         # (1/a)^n × a^m ÷ a^(-p) = a^(-n) × a^m ÷ a^(-p) = a^(-n+m+p)
-        exp1 = random.randint(1, exp_range[1])
-        exp2 = random.randint(1, exp_range[1])
-        exp3 = random.randint(1, exp_range[1])
+        exp1 = rng.randint(1, exp_range[1])
+        exp2 = rng.randint(1, exp_range[1])
+        exp3 = rng.randint(1, exp_range[1])
         problem = f"(1/{base})^{{{exp1}}} × {base}^{{{exp2}}} ÷ {base}^{{-{exp3}}}"
         result_exp = -exp1 + exp2 + exp3
         answer = f"{base}^{{{result_exp}}}"
     
     return problem, answer
 
-def generate_standard_problem(problem_type, base_range, exp_range, allow_negative):
+def generate_standard_problem(problem_type, base_range, exp_range, allow_negative, rng=random):
     """
     Generate standard 2-part exponential problems
     """
-    base = random.randint(*base_range)
+    base = rng.randint(*base_range)
     
     if problem_type == 'product':
         # a^m × a^n = a^(m+n)
-        exp1 = random.randint(*exp_range)
-        exp2 = random.randint(*exp_range)
-        if allow_negative and random.random() < 0.3:
-            exp1 = -exp1 if random.random() < 0.5 else exp1
-            exp2 = -exp2 if random.random() < 0.5 else exp2
+        exp1 = rng.randint(*exp_range)
+        exp2 = rng.randint(*exp_range)
+        if allow_negative and rng.random() < 0.3:
+            exp1 = -exp1 if rng.random() < 0.5 else exp1
+            exp2 = -exp2 if rng.random() < 0.5 else exp2
         
         problem = f"{base}^{{{exp1}}} × {base}^{{{exp2}}}"
         answer = f"{base}^{{{exp1 + exp2}}}"
         
     elif problem_type == 'quotient':
         # a^m ÷ a^n = a^(m-n)
-        exp1 = random.randint(*exp_range)
-        exp2 = random.randint(*exp_range)
-        if allow_negative and random.random() < 0.3:
-            exp1 = -exp1 if random.random() < 0.5 else exp1
-            exp2 = -exp2 if random.random() < 0.5 else exp2
+        exp1 = rng.randint(*exp_range)
+        exp2 = rng.randint(*exp_range)
+        if allow_negative and rng.random() < 0.3:
+            exp1 = -exp1 if rng.random() < 0.5 else exp1
+            exp2 = -exp2 if rng.random() < 0.5 else exp2
         
         problem = f"{base}^{{{exp1}}} ÷ {base}^{{{exp2}}}"
         answer = f"{base}^{{{exp1 - exp2}}}"
         
     elif problem_type == 'power':
         # (a^m)^n = a^(m×n)
-        exp1 = random.randint(*exp_range)
-        exp2 = random.randint(2, min(5, exp_range[1]))
-        if allow_negative and random.random() < 0.3:
-            exp1 = -exp1 if random.random() < 0.5 else exp1
-            exp2 = -exp2 if random.random() < 0.5 else exp2
+        exp1 = rng.randint(*exp_range)
+        exp2 = rng.randint(2, min(5, exp_range[1]))
+        if allow_negative and rng.random() < 0.3:
+            exp1 = -exp1 if rng.random() < 0.5 else exp1
+            exp2 = -exp2 if rng.random() < 0.5 else exp2
         
         problem = f"({base}^{{{exp1}}})^{{{exp2}}}"
         answer = f"{base}^{{{exp1 * exp2}}}"
         
     else:  # negative
         # a^(-n) = 1/a^n or mixed operations with negatives
-        if random.random() < 0.5:
-            exp = random.randint(2, exp_range[1])
+        if rng.random() < 0.5:
+            exp = rng.randint(2, exp_range[1])
             problem = f"{base}^{{-{exp}}}"
             answer = f"1/{base}^{{{exp}}}"
         else:
-            exp1 = random.randint(*exp_range)
-            exp2 = -random.randint(1, exp_range[1])
-            operation = random.choice(['×', '÷'])
+            exp1 = rng.randint(*exp_range)
+            exp2 = -rng.randint(1, exp_range[1])
+            operation = rng.choice(['×', '÷'])
             
             if operation == '×':
                 problem = f"{base}^{{{exp1}}} × {base}^{{{exp2}}}"
@@ -395,6 +1028,150 @@ def generate_standard_problem(problem_type, base_range, exp_range, allow_negativ
     
     return problem, answer
 
+# Batch templates take the base as {0} and the exponent columns as {1}...
+_POWER_ANSWER = '{0}^{{{1}}}'
+
+# Multi-part patterns as generate_multi_part_problem builds them:
+# (problem template over b, e0, e1, e2, p; index of the (a^m)^p part;
+# sign of each part in the answer)
+_MULTI_PART_PATTERNS = (
+    ('{0}^{{{1}}} × ({0}^{{{2}}})^{{{4}}} ÷ {0}^{{{3}}}', 1, (1, 1, -1)),
+    ('({0}^{{{1}}})^{{{4}}} × {0}^{{{2}}} ÷ {0}^{{{3}}}', 0, (1, 1, -1)),
+    ('{0}^{{{1}}} × ({0}^{{{2}}})^{{{4}}} × {0}^{{{3}}}', 1, (1, 1, 1)),
+)
+
+# Fraction mix patterns in generate_fraction_mix_problem order:
+# (problem template over b, e1, e2, e3; answer coefficients for e1, e2, e3)
+# power_of_fraction, whose answer is -e1*e2, is handled separately
+_FRACTION_MIX_PATTERNS = (
+    ('(1/{0})^{{{1}}} × {0}^{{-{2}}}', (-1, -1, 0)),
+    ('(1/{0})^{{{1}}} × {0}^{{{2}}}', (-1, 1, 0)),
+    ('(1/{0})^{{{1}}} ÷ {0}^{{-{2}}}', (-1, 1, 0)),
+    ('((1/{0})^{{{1}}})^{{{2}}}', None),
+    ('(1/{0})^{{{1}}} × {0}^{{{2}}} ÷ {0}^{{-{3}}}', (-1, 1, 1)),
+)
+
+def _format_problems(templates, pattern_ids, answers, bases, *exponents):
+    """
+    Format rows as (problem, answer) pairs
+    templates holds (problem_template, answer_template) per pattern id;
+    each pattern's rows are formatted by str.format mapped over columns
+    """
+    pairs = [None] * len(bases)
+    for pattern_id, (problem_template, answer_template) in enumerate(templates):
+        rows = np.flatnonzero(pattern_ids == pattern_id)
+        if rows.size == 0:
+            continue
+        b = bases[rows].tolist()
+        problems = map(problem_template.format, b, *(column[rows].tolist() for column in exponents))
+        answer_texts = map(answer_template.format, b, answers[rows].tolist())
+        for row, pair in zip(rows.tolist(), zip(problems, answer_texts)):
+            pairs[row] = pair
+    return pairs
+
+def _standard_problems_batch(gen, problem_type, bases, exp_range, allow_negative):
+    n = len(bases)
+    low, high = exp_range
+    
+    if problem_type == 'negative':
+        # Pattern 0 is a lone a^(-n), 1 and 2 mix a negative exponent with × or ÷
+        single = gen.random(n) < 0.5
+        single_exp = gen.integers(2, high + 1, n)
+        e1 = gen.integers(low, high + 1, n)
+        e2 = -gen.integers(1, high + 1, n)
+        times = gen.random(n) < 0.5
+        patterns = np.where(single, 0, np.where(times, 1, 2))
+        e1 = np.where(single, single_exp, e1)
+        answers = np.where(single, single_exp, np.where(times, e1 + e2, e1 - e2))
+        templates = (
+            ('{0}^{{-{1}}}', '1/{0}^{{{1}}}'),
+            ('{0}^{{{1}}} × {0}^{{{2}}}', _POWER_ANSWER),
+            ('{0}^{{{1}}} ÷ {0}^{{{2}}}', _POWER_ANSWER),
+        )
+        return _format_problems(templates, patterns, answers, bases, e1, e2)
+    
+    e1 = gen.integers(low, high + 1, n)
+    if problem_type == 'power':
+        e2 = gen.integers(2, min(5, high) + 1, n)
+    else:
+        e2 = gen.integers(low, high + 1, n)
+    if allow_negative:
+        flip = gen.random(n) < 0.3
+        e1 = np.where(flip & (gen.random(n) < 0.5), -e1, e1)
+        e2 = np.where(flip & (gen.random(n) < 0.5), -e2, e2)
+    
+    if problem_type == 'product':
+        template, answers = '{0}^{{{1}}} × {0}^{{{2}}}', e1 + e2
+    elif problem_type == 'quotient':
+        template, answers = '{0}^{{{1}}} ÷ {0}^{{{2}}}', e1 - e2
+    else:  # power
+        template, answers = '({0}^{{{1}}})^{{{2}}}', e1 * e2
+    return _format_problems(((template, _POWER_ANSWER),), np.zeros(n, dtype=int), answers, bases, e1, e2)
+
+def _multi_part_problems_batch(gen, bases, exp_range):
+    n = len(bases)
+    low, high = exp_range
+    patterns = gen.integers(len(_MULTI_PART_PATTERNS), size=n)
+    exps = gen.integers(low, high + 1, (n, 3))
+    exps = np.where(gen.random((n, 3)) < 0.3, -exps, exps)
+    
+    # A leading power part draws its power from 2-4, later ones from 2-3
+    power_slots = np.array([slot for _, slot, _ in _MULTI_PART_PATTERNS])[patterns]
+    powers = np.where(power_slots == 0, gen.integers(2, 5, n), gen.integers(2, 4, n))
+    multipliers = np.ones((n, 3), dtype=exps.dtype)
+    multipliers[np.arange(n), power_slots] = powers
+    signs = np.array([part_signs for _, _, part_signs in _MULTI_PART_PATTERNS])[patterns]
+    answers = (signs * exps * multipliers).sum(axis=1)
+    
+    templates = [(template, _POWER_ANSWER) for template, _, _ in _MULTI_PART_PATTERNS]
+    return _format_problems(templates, patterns, answers, bases, exps[:, 0], exps[:, 1], exps[:, 2], powers)
+
+def _fraction_mix_problems_batch(gen, bases, exp_range):
+    n = len(bases)
+    high = exp_range[1]
+    patterns = gen.integers(len(_FRACTION_MIX_PATTERNS), size=n)
+    exps = gen.integers(1, high + 1, (n, 3))
+    
+    power_of_fraction = patterns == 3
+    exps[:, 1] = np.where(power_of_fraction, gen.integers(2, 5, n), exps[:, 1])
+    coefficients = np.array([coef or (0, 0, 0) for _, coef in _FRACTION_MIX_PATTERNS])[patterns]
+    answers = np.where(power_of_fraction, -exps[:, 0] * exps[:, 1], (coefficients * exps).sum(axis=1))
+    
+    templates = [(template, _POWER_ANSWER) for template, _ in _FRACTION_MIX_PATTERNS]
+    return _format_problems(templates, patterns, answers, bases, exps[:, 0], exps[:, 1], exps[:, 2])
+
+def generate_exponential_problems(difficulty, count, rng=random):
+    """
+    Generate count problems with the same distribution as calling
+    generate_exponential_problem count times
+    All random draws are NumPy arrays per problem type and answers are
+    computed vectorially; strings are only formatted at the end
+    The NumPy generator is seeded from rng, so a seeded request stays
+    reproducible. Falls back to the per-problem loop without NumPy
+    """
+    if not load_numpy():
+        return [generate_exponential_problem(difficulty, rng) for _ in range(count)]
+    
+    base_range, exp_range, allow_negative, problem_types = _difficulty_settings(difficulty)
+    gen = np.random.default_rng(rng.getrandbits(64))
+    kinds = gen.integers(len(problem_types), size=count)
+    bases = gen.integers(base_range[0], base_range[1] + 1, size=count)
+    
+    problems = [None] * count
+    for kind_id, problem_type in enumerate(problem_types):
+        rows = np.flatnonzero(kinds == kind_id)
+        if rows.size == 0:
+            continue
+        if problem_type == 'multi_part':
+            pairs = _multi_part_problems_batch(gen, bases[rows], exp_range)
+        elif problem_type == 'fraction_mix':
+            pairs = _fraction_mix_problems_batch(gen, bases[rows], exp_range)
+        else:
+            pairs = _standard_problems_batch(gen, problem_type, bases[rows], exp_range, allow_negative)
+        for row, pair in zip(rows.tolist(), pairs):
+            problems[row] = pair
+    return problems
+
 def convert_to_latex_math(expression):
     """
     Convert our math expression format to LaTeX math format for matplotlib
@@ -417,24 +1194,30 @@ def convert_to_latex_math(expression):
     
     return f'${latex}$'
 
-def render_math_latex(expression, font_size=18, dpi=300, add_question_mark=True):
+def build_math_expression(expression, add_question_mark=True):
     """
-    Render small mathematical expression for top-left corner positioning
+    Build the mathtext source (without $ delimiters) for an expression
+    """
+    # Convert to LaTeX format
+    latex_expr = convert_to_latex_math(expression)
+    clean_latex = latex_expr.strip('$')
+    
+    # Add equals sign and question mark only for questions, not answers
+    if add_question_mark:
+        return f"{clean_latex} = \\,?"
+    return clean_latex
+
+def render_math_latex_pyplot(expression, font_size=18, dpi=300, add_question_mark=True):
+    """
+    Legacy pyplot renderer: fixed 2.5x0.4in figure with the expression inset
+    5% from the left. Kept as a fallback and as the benchmark baseline
     Returns PIL Image object
     """
-    if not LATEX_AVAILABLE:
+    if not load_math_stack():
         return None
     
     try:
-        # Convert to LaTeX format
-        latex_expr = convert_to_latex_math(expression)
-        clean_latex = latex_expr.strip('$')
-        
-        # Add equals sign and question mark only for questions, not answers
-        if add_question_mark:
-            full_expression = f"{clean_latex} = \\,?"
-        else:
-            full_expression = clean_latex
+        full_expression = build_math_expression(expression, add_question_mark)
         
         # Even wider figure size to accommodate variable expression lengths
         fig, ax = plt.subplots(figsize=(2.5, 0.4), dpi=dpi)
@@ -468,7 +1251,254 @@ def render_math_latex(expression, font_size=18, dpi=300, add_question_mark=True)
         
     except Exception as e:
         print(f"LaTeX rendering error: {e}")
+        metrics.inc('math_render_failures_total', renderer='pyplot')
+        return None
+
+_mathtext_parser = None
+_mathtext_lock = threading.Lock()
+
+def render_math_mathtext(expression, font_size=18, dpi=300, add_question_mark=True):
+    """
+    Figure-free renderer: parse and rasterize mathtext directly with
+    matplotlib's Agg mathtext backend, without pyplot or rcParams
+    Returns a tightly cropped grayscale PIL Image object
+    """
+    global _mathtext_parser
+    load_math_stack()
+    
+    full_expression = build_math_expression(expression, add_question_mark)
+    prop = FontProperties(size=font_size, family='serif', math_fontfamily='cm')
+    
+    # The parser keeps internal state, so serialize access across threads
+    with _mathtext_lock:
+        if _mathtext_parser is None:
+            _mathtext_parser = MathTextParser('agg')
+        result = _mathtext_parser.parse(f'${full_expression}$', dpi=dpi, prop=prop)
+        coverage = np.asarray(result.image)
+    
+    # Coverage is ink alpha (255 = black); invert onto a white background
+    img = Image.fromarray(255 - coverage, mode='L')
+    return _crop_to_content(img)
+
+def _crop_to_content(img, padding=2):
+    """Crop a dark-on-white image to its ink bounding box plus padding"""
+    gray = img.convert('L')
+    bbox = ImageOps.invert(gray).getbbox()
+    if bbox is None:
+        return gray
+    left, top, right, bottom = bbox
+    return gray.crop((max(left - padding, 0), max(top - padding, 0),
+                      min(right + padding, gray.width), min(bottom + padding, gray.height)))
+
+def render_math_latex(expression, font_size=18, dpi=300, add_question_mark=True):
+    """
+    Render small mathematical expression for top-left corner positioning
+    Uses the figure-free mathtext renderer, falling back to pyplot
+    Returns tightly cropped PIL Image object
+    """
+    if not load_math_stack():
+        return None
+    
+    try:
+        return render_math_mathtext(expression, font_size, dpi, add_question_mark)
+    except Exception as e:
+        print(f"Mathtext rendering error, falling back to pyplot: {e}")
+        metrics.inc('math_render_failures_total', renderer='mathtext')
+    
+    img = render_math_latex_pyplot(expression, font_size, dpi, add_question_mark)
+    if img is None:
+        return None
+    return _crop_to_content(img)
+
+def _png_size(png_bytes):
+    """Read (width, height) from a PNG's IHDR chunk without decoding it"""
+    return struct.unpack('>II', png_bytes[16:24])
+
+class MathImageCache:
+    """
+    Bounded LRU cache of rendered math PNGs, keyed on
+    (expression, font_size, dpi, add_question_mark)
+    Optionally backed by a persistent on-disk tier in cache_dir; namespace
+    separates disk entries produced by different renderers
+    """
+    def __init__(self, max_entries=512, cache_dir=None, namespace=''):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+    
+    def _disk_path(self, key):
+        digest = hashlib.sha256(repr((self.namespace, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.png')
+    
+    def _remember(self, key, png_bytes):
+        self._entries[key] = png_bytes
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def get(self, key):
+        """Return cached PNG bytes for key, or None"""
+        with self._lock:
+            png_bytes = self._entries.get(key)
+            if png_bytes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png_bytes
+        
+        if self.cache_dir:
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    png_bytes = f.read()
+            except OSError:
+                png_bytes = None
+            if png_bytes:
+                with self._lock:
+                    self._remember(key, png_bytes)
+                    self.disk_hits += 1
+                return png_bytes
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key, png_bytes):
+        with self._lock:
+            self._remember(key, png_bytes)
+        
+        if self.cache_dir:
+            # Write to a temp file and rename so readers never see partial PNGs
+            path = self._disk_path(key)
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(png_bytes)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Math image cache write error: {e}")
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+math_image_cache = MathImageCache(
+    max_entries=int(os.environ.get('MATH_CACHE_SIZE', 512)),
+    cache_dir=os.environ.get('MATH_CACHE_DIR') or None,
+    namespace='mathtext-tight',
+)
+
+def render_math_png(expression, font_size=18, dpi=300, add_question_mark=True):
+    """
+    Cached wrapper around render_math_latex
+    Returns PNG bytes, or None if the expression could not be rendered
+    """
+    key = (expression, font_size, dpi, add_question_mark)
+    png_bytes = math_image_cache.get(key)
+    if png_bytes is not None:
+        return png_bytes
+    
+    png_bytes = _render_math_png_uncached(key)
+    if png_bytes is not None:
+        math_image_cache.put(key, png_bytes)
+    return png_bytes
+
+def _render_math_png_uncached(key):
+    """Render one cache key to PNG bytes; also the process pool task"""
+    with metrics.span('rasterize'):
+        img = render_math_latex(*key)
+    if img is None:
         return None
+    
+    with metrics.span('encode'):
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+# Number of worker processes for the math render stage; 0 or 1 renders
+# serially on the request thread (for hosts that can't fork extra processes)
+MATH_RENDER_WORKERS = int(os.environ.get('MATH_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+
+_math_render_pool = None
+_math_render_pool_lock = threading.Lock()
+
+def _get_math_render_pool():
+    """Create the reusable render pool on first use"""
+    global _math_render_pool
+    with _math_render_pool_lock:
+        if _math_render_pool is None:
+            # spawn avoids inheriting locks held by other request threads
+            _math_render_pool = ProcessPoolExecutor(
+                max_workers=MATH_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+        return _math_render_pool
+
+def _reset_math_render_pool():
+    global _math_render_pool
+    with _math_render_pool_lock:
+        if _math_render_pool is not None:
+            _math_render_pool.shutdown(wait=False, cancel_futures=True)
+        _math_render_pool = None
+
+def prerender_math_expressions(problems, font_size=18, dpi=300):
+    """
+    Render every unique question and answer expression in one batch
+    Cache misses are fanned out to the process pool when MATH_RENDER_WORKERS > 1
+    Returns {key: png_bytes or None} for draw_math_raster
+    """
+    keys = []
+    for problem, answer in problems:
+        keys.append((format_math_problem_for_display(problem), font_size, dpi, True))
+        keys.append((format_math_problem_for_display(answer), font_size, dpi, False))
+    
+    rendered = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        png_bytes = math_image_cache.get(key)
+        if png_bytes is not None:
+            rendered[key] = png_bytes
+        else:
+            missing.append(key)
+    
+    if not missing:
+        return rendered
+    
+    results = None
+    if MATH_RENDER_WORKERS > 1 and len(missing) > 1:
+        try:
+            chunksize = max(1, len(missing) // (MATH_RENDER_WORKERS * 4))
+            results = list(_get_math_render_pool().map(
+                _render_math_png_uncached, missing, chunksize=chunksize))
+        except Exception as e:
+            # e.g. BrokenProcessPool, or no process support on this host
+            print(f"Math render pool failed, rendering serially: {e}")
+            metrics.inc('math_render_pool_failures_total')
+            _reset_math_render_pool()
+    
+    if results is None:
+        results = [_render_math_png_uncached(key) for key in missing]
+    
+    for key, png_bytes in zip(missing, results):
+        rendered[key] = png_bytes
+        if png_bytes is not None:
+            math_image_cache.put(key, png_bytes)
+    return rendered
 
 def draw_math_expression(canvas, x, y, expression, font_size=14):
     """
@@ -607,7 +1637,215 @@ def format_math_problem_for_display(problem_text):
     problem_text = ' '.join(problem_text.split())
     return problem_text
 
-def draw_question_page(canvas, problems_subset, page_number):
+def math_image_origin(x, y, cell_height, points_height):
+    """
+    Bottom-left corner for a tightly cropped math image in a grid cell
+    Matches where the legacy 2.5x0.4in figure placed its text: 5% into the
+    default subplot axes (left=0.125, right=0.9, bottom=0.11, top=0.88)
+    """
+    margin_from_edge = 15
+    text_inset = (0.125 + 0.05 * (0.9 - 0.125)) * 2.5 * 72
+    axes_center = 0.11 + (0.88 - 0.11) / 2
+    box_center = y + cell_height - 25 - (1 - axes_center) * 0.4 * 72  # Extra space for problem number
+    return x + margin_from_edge + text_inset, box_center - points_height / 2
+
+# Glyph outlines shared by every vector expression, keyed by matplotlib's
+# glyph repr, plus a stable PDF form name for each glyph and the outline
+# under that name for the form writer
+_math_glyph_outlines = OrderedDict()
+_math_glyph_forms = {}
+_math_form_outlines = {}
+_text_to_path = None
+
+def _path_ops(vertices, codes):
+    """
+    Convert matplotlib path vertices/codes into PDF path operations:
+    ('M', x, y), ('L', x, y), ('C', x1, y1, x2, y2, x3, y3) or ('Z',)
+    """
+    ops = []
+    current = (0.0, 0.0)
+    for segment, code in Path(vertices, codes).iter_segments(curves=True, simplify=False):
+        if code == Path.MOVETO:
+            current = tuple(segment[-2:])
+            ops.append(('M',) + current)
+        elif code == Path.LINETO:
+            current = tuple(segment[-2:])
+            ops.append(('L',) + current)
+        elif code == Path.CURVE3:
+            # Promote quadratic TrueType curves to the cubic curves PDF supports
+            qx, qy, ex, ey = segment
+            cx, cy = current
+            ops.append(('C', cx + 2 / 3 * (qx - cx), cy + 2 / 3 * (qy - cy),
+                        ex + 2 / 3 * (qx - ex), ey + 2 / 3 * (qy - ey), ex, ey))
+            current = (ex, ey)
+        elif code == Path.CURVE4:
+            ops.append(('C',) + tuple(segment))
+            current = tuple(segment[-2:])
+        elif code == Path.CLOSEPOLY:
+            ops.append(('Z',))
+    return tuple(ops)
+
+@lru_cache(maxsize=1024)
+def math_vector_layout(expression, font_size=18, add_question_mark=True):
+    """
+    Lay out an expression as positioned glyphs and rules, in points
+    Returns (glyphs, rects, bbox): glyphs are (form_name, x, y, scale) with
+    outlines in _math_glyph_outlines, rects are (x, y, w, h) and bbox is
+    (x0, y0, x1, y1)
+    """
+    global _text_to_path
+    load_math_stack()
+    
+    full_expression = build_math_expression(expression, add_question_mark)
+    prop = FontProperties(size=font_size, family='serif', math_fontfamily='cm')
+    
+    with _mathtext_lock:
+        if _text_to_path is None:
+            _text_to_path = TextToPath()
+        glyph_info, glyph_map, rects = _text_to_path.get_glyphs_mathtext(
+            prop, f'${full_expression}$', glyph_map=_math_glyph_outlines)
+        _math_glyph_outlines.update(glyph_map)
+        for glyph_repr, _, _, _ in glyph_info:
+            if glyph_repr not in _math_glyph_forms:
+                # Derive the name from the glyph so output is byte-identical across processes
+                digest = hashlib.sha1(glyph_repr.encode('utf-8')).hexdigest()[:12]
+                name = f'MathGlyph{digest}'
+                _math_glyph_forms[glyph_repr] = name
+                _math_form_outlines[name] = _math_glyph_outlines[glyph_repr]
+    
+    # Layout is computed at TextToPath.FONT_SCALE; bring it to font_size
+    k = font_size / TextToPath.FONT_SCALE
+    glyphs = []
+    xs, ys = [], []
+    for glyph_repr, ox, oy, scale in glyph_info:
+        vertices = _math_glyph_outlines[glyph_repr][0]
+        if len(vertices):
+            xs.extend(((vertices[:, 0] * scale + ox) * k).tolist())
+            ys.extend(((vertices[:, 1] * scale + oy) * k).tolist())
+        glyphs.append((_math_glyph_forms[glyph_repr], ox * k, oy * k, scale * k))
+    
+    rules = []
+    for vertices, _ in rects:
+        (rx0, ry0), (rx1, ry1) = vertices[0], vertices[2]
+        rules.append((rx0 * k, ry0 * k, (rx1 - rx0) * k, (ry1 - ry0) * k))
+        xs.extend((rx0 * k, rx1 * k))
+        ys.extend((ry0 * k, ry1 * k))
+    
+    if not xs:
+        raise ValueError(f"No glyph outlines for expression '{expression}'")
+    
+    return tuple(glyphs), tuple(rules), (min(xs), min(ys), max(xs), max(ys))
+
+def _fill_path_ops(canvas, ops):
+    """Fill a glyph outline given as _path_ops operations"""
+    p = canvas.beginPath()
+    for op in ops:
+        if op[0] == 'M':
+            p.moveTo(op[1], op[2])
+        elif op[0] == 'L':
+            p.lineTo(op[1], op[2])
+        elif op[0] == 'C':
+            p.curveTo(*op[1:])
+        else:
+            p.close()
+    canvas.drawPath(p, stroke=0, fill=1, fillMode=FILL_NON_ZERO)
+
+def _ensure_math_glyph_forms(canvas, glyphs):
+    """Define each glyph's outline as a form XObject once per document"""
+    defined = canvas.__dict__.setdefault('_math_glyph_forms_defined', set())
+    
+    for name, _, _, _ in glyphs:
+        if name in defined:
+            continue
+        # Written once under _mathtext_lock before the name is handed out
+        vertices, codes = _math_form_outlines[name]
+        if len(vertices):
+            x0, y0 = vertices.min(axis=0)
+            x1, y1 = vertices.max(axis=0)
+        else:
+            x0 = y0 = x1 = y1 = 0
+        
+        canvas.beginForm(name, x0, y0, x1, y1)
+        try:
+            canvas.setFillColor(colors.black)
+            _fill_path_ops(canvas, _path_ops(vertices, codes))
+        finally:
+            canvas.endForm()
+        defined.add(name)
+
+def draw_math_vector(canvas, x, y, cell_height, expression, add_question_mark=True):
+    """
+    Draw an expression as vector glyphs, positioned like the raster image
+    Each unique glyph is a form XObject, so repeats cost one placement each
+    """
+    glyphs, rules, (x0, y0, x1, y1) = math_vector_layout(expression, 18, add_question_mark)
+    _ensure_math_glyph_forms(canvas, glyphs)
+    img_x, img_y = math_image_origin(x, y, cell_height, y1 - y0)
+    
+    canvas.saveState()
+    canvas.setFillColor(colors.black)
+    canvas.translate(img_x - x0, img_y - y0)
+    for name, gx, gy, scale in glyphs:
+        canvas.saveState()
+        canvas.transform(scale, 0, 0, scale, gx, gy)
+        canvas.doForm(name)
+        canvas.restoreState()
+    for rx, ry, rw, rh in rules:
+        canvas.rect(rx, ry, rw, rh, stroke=0, fill=1)
+    canvas.restoreState()
+
+def draw_math_raster(canvas, x, y, cell_height, expression, add_question_mark=True,
+                     rendered=None):
+    """
+    Draw an expression as a cached 300-dpi PNG, taking it from the
+    prerendered batch when available
+    Returns False if the expression could not be rendered
+    """
+    key = (expression, 18, 300, add_question_mark)
+    if rendered is not None and key in rendered:
+        math_png = rendered[key]
+    else:
+        math_png = render_math_png(*key)
+    if not math_png:
+        return False
+    
+    img_width, img_height = _png_size(math_png)
+    
+    # Convert pixels to points for positioning
+    points_width = img_width * 72 / 300
+    points_height = img_height * 72 / 300
+    
+    # Position below problem number
+    img_x, img_y = math_image_origin(x, y, cell_height, points_height)
+    
+    img_reader = ImageReader(BytesIO(math_png))
+    canvas.drawImage(img_reader, img_x, img_y, points_width, points_height)
+    return True
+
+def draw_math_in_cell(canvas, x, y, cell_height, expression, add_question_mark=True,
+                      output_mode='raster', rendered=None):
+    """
+    Draw an expression below the problem number of a grid cell
+    In vector mode, falls back to the raster path per expression
+    Returns False if neither path could draw it
+    """
+    if not load_math_stack():
+        return False
+    
+    if output_mode == 'vector':
+        try:
+            draw_math_vector(canvas, x, y, cell_height, expression, add_question_mark)
+            return True
+        except Exception as e:
+            print(f"Vector math rendering error, falling back to raster: {e}")
+            metrics.inc('math_render_failures_total', renderer='vector')
+    
+    if draw_math_raster(canvas, x, y, cell_height, expression, add_question_mark, rendered):
+        return True
+    metrics.inc('math_render_failures_total', renderer='raster')
+    return False
+
+def draw_question_page(canvas, problems_subset, page_number, output_mode='raster', rendered=None):
     """
     Draw clean 2x3 grid with only math questions - no titles, borders, or numbers
     """
@@ -643,33 +1881,12 @@ def draw_question_page(canvas, problems_subset, page_number):
         canvas.setFont("Helvetica-Bold", 10)
         canvas.drawString(x + 15, y + cell_height - 12, f"{problem_num}.")
         
-        # Generate small LaTeX image positioned in top-left corner below number
+        # Generate small LaTeX expression positioned in top-left corner below number
         try:
             formatted_problem = format_math_problem_for_display(problem)
-            math_img = render_math_latex(formatted_problem)
             
-            if math_img:
-                img_width, img_height = math_img.size
-                
-                # Convert pixels to points for positioning
-                points_width = img_width * 72 / 300
-                points_height = img_height * 72 / 300
-                
-                
-                # Position below problem number with small margin
-                margin_from_edge = 15
-                img_x = x + margin_from_edge
-                img_y = y + cell_height - points_height - 25  # Extra space for problem number
-                
-                # Draw the small LaTeX image in top-left corner at proper scale 
-                img_buffer = BytesIO()
-                math_img.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
-                
-                img_reader = ImageReader(img_buffer)
-                canvas.drawImage(img_reader, img_x, img_y, points_width, points_height)
-                
-            else:
+            if not draw_math_in_cell(canvas, x, y, cell_height, formatted_problem,
+                                     output_mode=output_mode, rendered=rendered):
                 # Smaller fallback text in top-left corner
                 canvas.setFont("Helvetica", 8)
                 text_x = x + 15
@@ -683,7 +1900,7 @@ def draw_question_page(canvas, problems_subset, page_number):
             text_y = y + cell_height - 35
             canvas.drawString(text_x, text_y, f"{problem} = ?")
 
-def draw_answer_page(canvas, problems_subset, page_number):
+def draw_answer_page(canvas, problems_subset, page_number, output_mode='raster', rendered=None):
     """
     Draw clean 2x3 grid with problem numbers and answers - no titles or borders
     """
@@ -719,32 +1936,13 @@ def draw_answer_page(canvas, problems_subset, page_number):
         canvas.setFont("Helvetica-Bold", 10)
         canvas.drawString(x + 15, y + cell_height - 12, f"{problem_num}.")
         
-        # Generate small LaTeX image for the answer positioned below number
+        # Generate small LaTeX expression for the answer positioned below number
         try:
             formatted_answer = format_math_problem_for_display(answer)
-            answer_img = render_math_latex(formatted_answer, add_question_mark=False)
             
-            if answer_img:
-                img_width, img_height = answer_img.size
-                
-                # Convert pixels to points for positioning
-                points_width = img_width * 72 / 300
-                points_height = img_height * 72 / 300
-                
-                # Position below problem number
-                margin_from_edge = 15
-                img_x = x + margin_from_edge
-                img_y = y + cell_height - points_height - 25  # Extra space for problem number
-                
-                # Draw the small answer image at proper scale
-                img_buffer = BytesIO()
-                answer_img.save(img_buffer, format='PNG')
-                img_buffer.seek(0)
-                
-                img_reader = ImageReader(img_buffer)
-                canvas.drawImage(img_reader, img_x, img_y, points_width, points_height)
-                
-            else:
+            if not draw_math_in_cell(canvas, x, y, cell_height, formatted_answer,
+                                     add_question_mark=False, output_mode=output_mode,
+                                     rendered=rendered):
                 # Smaller fallback text for answer
                 canvas.setFont("Helvetica", 8)
                 text_x = x + 15
@@ -758,74 +1956,345 @@ def draw_answer_page(canvas, problems_subset, page_number):
             text_y = y + cell_height - 35
             canvas.drawString(text_x, text_y, answer)
 
-def generate_math_pdf(problems, num_problems):
+# Rendered PDFs larger than this are moved out of memory into an anonymous
+# temp file while they are being sent
+PDF_SPILL_THRESHOLD = int(os.environ.get('PDF_SPILL_THRESHOLD', 16 * 1024 * 1024))
+
+pdf_spill_stats = {'files': 0, 'bytes': 0}
+_pdf_spill_lock = threading.Lock()
+
+def _finish_pdf_buffer(buffer):
     """
-    Generate PDF with math problems - questions and answers on separate pages for double-sided printing
+    Rewind a rendered PDF buffer, spilling it to disk when it is larger
+    than PDF_SPILL_THRESHOLD
+    The spill file is unlinked on creation, so closing it (send_file does
+    this when the response ends) or process exit always removes it
     """
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-    c = canvas.Canvas(temp_file.name, pagesize=letter)
-    
-    # Calculate number of question pages needed (6 problems per page)
-    problems_per_page = 6
-    num_question_pages = (num_problems + problems_per_page - 1) // problems_per_page
+    size = buffer.getbuffer().nbytes
+    if size <= PDF_SPILL_THRESHOLD:
+        buffer.seek(0)
+        return buffer
     
-    # Generate question pages
-    for page_num in range(1, num_question_pages + 1):
-        start_idx = (page_num - 1) * problems_per_page
-        end_idx = min(start_idx + problems_per_page, num_problems)
-        problems_subset = problems[start_idx:end_idx]
-        
-        if page_num > 1:
-            c.showPage()
-        
-        draw_question_page(c, problems_subset, page_num)
+    spill = tempfile.TemporaryFile(suffix='.pdf')
+    spill.write(buffer.getbuffer())
+    spill.seek(0)
+    buffer.close()
     
-    # Generate answer pages
-    for page_num in range(1, num_question_pages + 1):
-        start_idx = (page_num - 1) * problems_per_page
-        end_idx = min(start_idx + problems_per_page, num_problems)
-        problems_subset = problems[start_idx:end_idx]
+    with _pdf_spill_lock:
+        pdf_spill_stats['files'] += 1
+        pdf_spill_stats['bytes'] += size
+    return spill
+
+class PdfResultCache:
+    """
+    Size-bounded LRU cache of finished PDFs, keyed by a hash of the
+    normalized rendering inputs (also used as the response's strong ETag)
+    PDFs larger than max_entry_bytes are served but not cached
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 8
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(inputs):
+        # Canvases are created with invariant=1, so equal inputs give equal bytes
+        return hashlib.sha256(repr(inputs).encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        with self._lock:
+            pdf_bytes = self._entries.get(key)
+            if pdf_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf_bytes
+    
+    def put(self, key, pdf_bytes):
+        if len(pdf_bytes) > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = pdf_bytes
+            self._size += len(pdf_bytes)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+pdf_result_cache = PdfResultCache(
+    max_bytes=int(os.environ.get('PDF_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+)
+
+def generate_math_pdf(problems, num_problems, output_mode=None):
+    """
+    Generate PDF with math problems - questions and answers on separate pages for double-sided printing
+    output_mode is 'raster' (PNG per expression) or 'vector' (glyph outlines)
+    Returns a file object positioned at the start of the PDF
+    """
+    output_mode = output_mode or MATH_OUTPUT_MODE
+    
+    # Render stage: all raster expressions in one batch before any page is drawn
+    rendered = None
+    if output_mode == 'raster' and load_math_stack():
+        with metrics.span('render'):
+            rendered = prerender_math_expressions(problems[:num_problems])
+    
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    
+    with metrics.span('draw'):
+        # Calculate number of question pages needed (6 problems per page)
+        problems_per_page = 6
+        num_question_pages = (num_problems + problems_per_page - 1) // problems_per_page
+        
+        # Generate question pages
+        for page_num in range(1, num_question_pages + 1):
+            start_idx = (page_num - 1) * problems_per_page
+            end_idx = min(start_idx + problems_per_page, num_problems)
+            problems_subset = problems[start_idx:end_idx]
+            
+            if page_num > 1:
+                c.showPage()
+            
+            draw_question_page(c, problems_subset, page_num, output_mode, rendered)
         
-        c.showPage()  # New page for answers
-        draw_answer_page(c, problems_subset, page_num)
+        # Generate answer pages
+        for page_num in range(1, num_question_pages + 1):
+            start_idx = (page_num - 1) * problems_per_page
+            end_idx = min(start_idx + problems_per_page, num_problems)
+            problems_subset = problems[start_idx:end_idx]
+            
+            c.showPage()  # New page for answers
+            draw_answer_page(c, problems_subset, page_num, output_mode, rendered)
     
-    c.save()
-    return temp_file.name
+    with metrics.span('save'):
+        c.save()
+    return _finish_pdf_buffer(buffer)
 
-def generate_pdf(characters):
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-    c = canvas.Canvas(temp_file.name, pagesize=letter)
-    
-    # Try to register a built-in CID font first (more reliable)
-    font_name = "Helvetica"  # fallback
-    font_size = 32
-    
-    try:
-        # Try built-in CID fonts for Chinese (more reliable than TTF)
-        pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
-        font_name = "STSong-Light"
-        print("Using built-in STSong-Light CID font")
-    except Exception as e:
-        print(f"Failed to load STSong-Light: {e}")
+class SubsetCachingTTFont(TTFont):
+    """
+    A TrueType font embedded as per-document subsets of the glyphs used,
+    like TTFont, with the built subset font programs kept in an LRU keyed
+    by a hash of their code points
+    makeSubset reads the font file through a shared cursor, so building
+    is also serialized across request threads
+    """
+    def __init__(self, name, filename, subfont_index=0, cache_size=64):
+        super().__init__(name, filename, subfontIndex=subfont_index)
+        self.cache_size = cache_size
+        self.hits = self.misses = 0
+        self._subsets = OrderedDict()
+        self._subset_lock = threading.Lock()
+        self._make_subset = self.face.makeSubset
+        # TTFontFace.addSubsetObjects looks makeSubset up on the face
+        self.face.makeSubset = self._cached_subset
+    
+    def _cached_subset(self, subset):
+        key = hashlib.sha1(array('I', subset).tobytes()).hexdigest()
+        with self._subset_lock:
+            data = self._subsets.get(key)
+            if data is not None:
+                self._subsets.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+            data = self._make_subset(subset)
+            self._subsets[key] = data
+            while len(self._subsets) > self.cache_size:
+                self._subsets.popitem(last=False)
+            return data
+    
+    def assign(self, doc, characters):
+        """
+        Give characters their subset codes in sorted order, so a character
+        set builds the same subsets (and hits the cache) in any order
+        """
+        self.splitString(''.join(sorted(set(characters))), doc)
+    
+    def stats(self):
+        with self._subset_lock:
+            return {
+                'entries': len(self._subsets),
+                'max_entries': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+class FontRegistry:
+    """
+    Resolves and registers the CJK font once per process
+    Uses the TrueType font at ttf_path when given, embedded as subsets;
+    otherwise (or if it fails to load) tries each CID font in order and
+    falls back to Helvetica, remembering which one is active, why earlier
+    candidates failed, and glyph widths
+    """
+    FALLBACK = "Helvetica"
+    
+    def __init__(self, candidates=('STSong-Light', 'MSung-Light'), ttf_path=None, subfont_index=0,
+                 subset_cache_size=64):
+        self.candidates = candidates
+        self.ttf_path = ttf_path
+        self.subfont_index = subfont_index
+        self.subset_cache_size = subset_cache_size
+        self.font_name = None
+        self.embedded_font = None
+        self.errors = {}
+        self._widths = {}
+        self._lock = threading.Lock()
+    
+    def _register_embedded(self):
+        """Register the TrueType font at ttf_path; returns its name or None"""
+        name = os.path.splitext(os.path.basename(self.ttf_path))[0]
         try:
-            pdfmetrics.registerFont(UnicodeCIDFont('MSung-Light'))
-            font_name = "MSung-Light"
-            print("Using built-in MSung-Light CID font")
+            # OpenType fonts with CFF outlines are rejected here by reportlab
+            font = SubsetCachingTTFont(name, self.ttf_path, self.subfont_index, self.subset_cache_size)
+            pdfmetrics.registerFont(font)
+            # reportlab keeps the first font registered under a name
+            font = pdfmetrics.getFont(name)
         except Exception as e:
-            print(f"Failed to load MSung-Light: {e}")
-            # For PythonAnywhere - use fallback method
-            try:
-                # Try to use DejaVu Sans which supports some Unicode
-                font_name = "Helvetica"
-                print("Using Helvetica fallback - Chinese characters may display as boxes")
-            except Exception as e:
-                print(f"Final fallback failed: {e}")
-                font_name = "Helvetica"
-    
-    if font_name == "Helvetica":
-        print("Warning: Using Helvetica fallback - Chinese characters may not display")
-    
-    c.setFont(font_name, font_size)
+            self.errors[self.ttf_path] = str(e)
+            print(f"Failed to load {self.ttf_path}: {e}")
+            return None
+        self.embedded_font = font
+        print(f"Using embedded {name} TrueType font subsets")
+        return name
+    
+    def resolve(self):
+        """Return the registered font name, registering it on first use"""
+        if self.font_name is not None:
+            return self.font_name
+        
+        with self._lock:
+            if self.font_name is not None:
+                return self.font_name
+            
+            font_name = (self.ttf_path and self._register_embedded()) or self.FALLBACK
+            for candidate in self.candidates if font_name == self.FALLBACK else ():
+                try:
+                    # Built-in CID fonts for Chinese (more reliable than TTF)
+                    pdfmetrics.registerFont(UnicodeCIDFont(candidate))
+                    font_name = candidate
+                    print(f"Using built-in {font_name} CID font")
+                    break
+                except Exception as e:
+                    self.errors[candidate] = str(e)
+                    print(f"Failed to load {candidate}: {e}")
+            
+            if font_name == self.FALLBACK:
+                print("Warning: Using Helvetica fallback - Chinese characters may not display")
+            
+            self.font_name = font_name
+            return font_name
+    
+    @property
+    def fallback_active(self):
+        return self.resolve() == self.FALLBACK
+    
+    @property
+    def outline_path(self):
+        """TrueType file to take tracing glyph outlines from, or None to draw text"""
+        self.resolve()
+        # matplotlib reads only the first face of a .ttc collection
+        if self.embedded_font is None or self.subfont_index:
+            return None
+        return self.ttf_path
+    
+    def prepare(self, canvas, characters):
+        """Assign embedded subset codes for characters before they are drawn"""
+        self.resolve()
+        if self.embedded_font is not None:
+            self.embedded_font.assign(canvas._doc, characters)
+    
+    def char_width(self, char, font_size):
+        """Cached stringWidth of a single character in the resolved font"""
+        font_name = self.resolve()
+        width = self._widths.get(char)
+        if width is None:
+            # Widths scale linearly, so cache them at 1pt
+            width = pdfmetrics.stringWidth(char, font_name, 1)
+            self._widths[char] = width
+        return width * font_size
+    
+    def status(self):
+        font_name = self.resolve()
+        status = {
+            'font': font_name,
+            'fallback_active': font_name == self.FALLBACK,
+            'embedded': self.embedded_font is not None,
+            'errors': dict(self.errors),
+        }
+        if self.embedded_font is not None:
+            status['subset_cache'] = self.embedded_font.stats()
+        return status
+
+# CJK_FONT_PATH points at a local TrueType CJK font (.ttf, .ttc, or .otf with
+# TrueType outlines) to embed in character sheets instead of the viewer's
+# STSong-Light; CJK_FONT_SUBFONT picks the face inside a .ttc collection
+cjk_fonts = FontRegistry(
+    ttf_path=os.environ.get('CJK_FONT_PATH') or None,
+    subfont_index=int(os.environ.get('CJK_FONT_SUBFONT', 0)),
+    subset_cache_size=int(os.environ.get('FONT_SUBSET_CACHE_SIZE', 64)),
+)
+
+def generate_pdf(characters):
+    """
+    Generate 5x10 grid practice sheets for the given characters
+    Returns a file object positioned at the start of the PDF
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    with metrics.span('draw'):
+        draw_character_sheet(c, characters)
+    with metrics.span('save'):
+        c.save()
+    return _finish_pdf_buffer(buffer)
+
+CHARACTER_GRID_FORM = 'character-grid'
+
+def _ensure_character_grid_form(c, cells, cell_width, cell_height):
+    """Define the full 5x10 page of cell borders as a form XObject once per document"""
+    if c.hasForm(CHARACTER_GRID_FORM):
+        return
+    c.beginForm(CHARACTER_GRID_FORM)
+    for x, y in cells:
+        c.rect(x, y, cell_width, cell_height)
+    c.endForm()
+
+def draw_character_sheet(c, characters):
+    """
+    Draw characters onto the canvas as 5x10 grid pages, starting on the
+    current page; callers start a new page between sheets
+    Full pages place one shared grid form, and each page's characters are
+    emitted as a single text object
+    """
+    font_name = cjk_fonts.resolve()
+    font_size = 32
+    fallback = font_name == FontRegistry.FALLBACK
+    if fallback:
+        metrics.inc('cjk_font_fallback_sheets_total')
     
     width, height = letter  # 612 x 792 points
     margin = 50
@@ -842,60 +2311,318 @@ def generate_pdf(characters):
     y_start = height - margin - cell_height
     
     chars_per_page = chars_per_row * rows_per_page  # 50 characters per page
+    cells = [(x_start + col * cell_width, y_start - row * cell_height)
+             for row in range(rows_per_page) for col in range(chars_per_row)]
+    _ensure_character_grid_form(c, cells, cell_width, cell_height)
+    cjk_fonts.prepare(c, characters)
+    
+    def draw_cell(text, char, x, y):
+        # The Helvetica fallback can only show latin-1; draw a placeholder otherwise
+        if not fallback or char <= '\xff':
+            try:
+                text_width = cjk_fonts.char_width(char, font_size)
+                text.setTextOrigin(x + (cell_width - text_width) / 2, y + cell_height/2 - font_size/3)
+                text.textOut(char)
+                return
+            except Exception as e:
+                print(f"Error drawing character '{char}': {e}")
+                metrics.inc('character_draw_errors_total')
+        text.setFont("Helvetica", 16)
+        text.setTextOrigin(x + cell_width/2 - 5, y + cell_height/2 - 5)
+        text.textOut("□")
+        text.setFont(font_name, font_size)  # Reset font
+    
+    for page_start in range(0, len(characters), chars_per_page):
+        if page_start > 0:
+            c.showPage()
+        page_chars = characters[page_start:page_start + chars_per_page]
+        
+        # Cell borders: the shared form, or only the filled cells of a partial last page
+        if len(page_chars) == chars_per_page:
+            c.doForm(CHARACTER_GRID_FORM)
+        else:
+            for x, y in cells[:len(page_chars)]:
+                c.rect(x, y, cell_width, cell_height)
+        
+        text = c.beginText()
+        text.setFont(font_name, font_size)
+        char_space = 0
+        for row_start in range(0, len(page_chars), chars_per_row):
+            row_chars = page_chars[row_start:row_start + chars_per_row]
+            row_cells = cells[row_start:row_start + chars_per_row]
+            widths = set() if fallback else {cjk_fonts.char_width(char, font_size) for char in row_chars}
+            if len(widths) == 1:
+                # Equal widths (every CJK glyph): one string per row, with the
+                # character spacing making up the rest of the cell pitch
+                text_width = widths.pop()
+                x, y = row_cells[0]
+                if char_space != cell_width - text_width:
+                    char_space = cell_width - text_width
+                    text.setCharSpace(char_space)
+                text.setTextOrigin(x + (cell_width - text_width) / 2, y + cell_height/2 - font_size/3)
+                text.textOut(''.join(row_chars))
+            else:
+                for char, (x, y) in zip(row_chars, row_cells):
+                    draw_cell(text, char, x, y)
+        if char_space:
+            text.setCharSpace(0)
+        c.drawText(text)
+
+# Tracing sheets: one row per character, the model character followed by
+# TRACE_COPIES light grey copies to trace over, each in a 田字格 cell
+TRACE_COPIES = int(os.environ.get('TRACE_COPIES', 5))
+TRACE_GRAY = 0.8
+SHEET_STYLES = ('grid', 'tracing')
+
+@lru_cache(maxsize=4096)
+def glyph_outline(char, font_path):
+    """
+    Outline of char in the TrueType font at font_path, in 1000 units per em
+    Returns (ops, bbox) with ops as _path_ops operations, or None when the
+    font has no glyph for char or matplotlib is unavailable
+    """
+    global _text_to_path
+    if not load_math_stack():
+        return None
+    if get_font(font_path).get_char_index(ord(char)) == 0:
+        return None
+    
+    with _mathtext_lock:
+        if _text_to_path is None:
+            _text_to_path = TextToPath()
+        vertices, codes = _text_to_path.get_text_path(FontProperties(fname=font_path), char)
+    if not len(vertices):
+        return None
+    
+    vertices = np.asarray(vertices, dtype=float) * (1000 / TextToPath.FONT_SCALE)
+    x0, y0 = vertices.min(axis=0)
+    x1, y1 = vertices.max(axis=0)
+    return _path_ops(vertices, codes), (float(x0), float(y0), float(x1), float(y1))
+
+def _ensure_trace_glyph_form(c, char, outline):
+    """Define a glyph outline as a form XObject once per document; returns its name"""
+    name = f'TraceGlyph{ord(char):X}'
+    if not c.hasForm(name):
+        ops, bbox = outline
+        c.beginForm(name, *bbox)
+        try:
+            # No fill colour here: the model and its trace copies share the form
+            _fill_path_ops(c, ops)
+        finally:
+            c.endForm()
+    return name
+
+def _ensure_tracing_row_form(c, columns, cell):
+    """Define a row of 田字格 cells as a form XObject once per document"""
+    name = f'tracing-row-{columns}'
+    if c.hasForm(name):
+        return name
+    
+    c.beginForm(name, 0, 0, columns * cell, cell)
+    c.setStrokeGray(0.7)
+    c.setLineWidth(0.5)
+    c.setDash(3, 3)
+    for col in range(columns):
+        x = col * cell
+        c.line(x + cell / 2, 0, x + cell / 2, cell)
+        c.line(x, cell / 2, x + cell, cell / 2)
+    c.setDash()
+    c.setStrokeGray(0.4)
+    c.setLineWidth(1)
+    for col in range(columns):
+        c.rect(col * cell, 0, cell, cell)
+    c.endForm()
+    return name
+
+def draw_tracing_sheet(c, characters, copies=None):
+    """
+    Draw one tracing row per character, starting on the current page
+    Glyphs come from glyph_outline when the embedded font allows it, so each
+    unique character is extracted once and placed as a form; otherwise the
+    CJK font draws them as text
+    """
+    copies = TRACE_COPIES if copies is None else copies
+    font_name = cjk_fonts.resolve()
+    fallback = font_name == FontRegistry.FALLBACK
+    if fallback:
+        metrics.inc('cjk_font_fallback_sheets_total')
+    font_path = cjk_fonts.outline_path
+    
+    width, height = letter  # 612 x 792 points
+    margin = 50
+    columns = copies + 1
+    cell = (width - 2 * margin) / columns
+    rows_per_page = int((height - 2 * margin) // cell)
+    glyph_size = cell * 0.8
+    row_form = _ensure_tracing_row_form(c, columns, cell)
     
     for i, char in enumerate(characters):
-        page_num = i // chars_per_page
-        char_on_page = i % chars_per_page
-        row = char_on_page // chars_per_row
-        col = char_on_page % chars_per_row
-        
-        # Check if we need a new page
-        if i > 0 and char_on_page == 0:
+        row = i % rows_per_page
+        if i > 0 and row == 0:
             c.showPage()
-            c.setFont(font_name, font_size)
-            
-        x = x_start + col * cell_width
-        y = y_start - row * cell_height
+        y = height - margin - (row + 1) * cell
+        
+        c.saveState()
+        c.translate(margin, y)
+        c.doForm(row_form)
+        
+        outline = glyph_outline(char, font_path) if font_path else None
+        if outline is not None:
+            form = _ensure_trace_glyph_form(c, char, outline)
+            x0, y0, x1, y1 = outline[1]
+            scale = glyph_size / 1000
+            for col in range(columns):
+                c.saveState()
+                c.setFillGray(0 if col == 0 else TRACE_GRAY)
+                c.transform(scale, 0, 0, scale,
+                            (col + 0.5) * cell - (x0 + x1) / 2 * scale, cell / 2 - (y0 + y1) / 2 * scale)
+                c.doForm(form)
+                c.restoreState()
+        else:
+            # The Helvetica fallback can only show latin-1; draw a placeholder otherwise
+            label = char if not fallback or char <= '\xff' else "□"
+            c.setFont(font_name, glyph_size)
+            for col in range(columns):
+                c.setFillGray(0 if col == 0 else TRACE_GRAY)
+                c.drawCentredString((col + 0.5) * cell, cell / 2 - glyph_size / 3, label)
+        c.restoreState()
+
+def generate_tracing_pdf(characters):
+    """
+    Generate tracing-row practice sheets for the given characters
+    Returns a file object positioned at the start of the PDF
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    with metrics.span('draw'):
+        draw_tracing_sheet(c, characters)
+    with metrics.span('save'):
+        c.save()
+    return _finish_pdf_buffer(buffer)
+
+def generate_sheet_pdf(characters, style='grid'):
+    """Generate the practice PDF in one of SHEET_STYLES"""
+    if style == 'tracing':
+        return generate_tracing_pdf(characters)
+    return generate_pdf(characters)
+
+def _sheet_style(form):
+    style = form.get('sheet_style', 'grid')
+    return style if style in SHEET_STYLES else 'grid'
+
+# Upper bound on sheets per /generate-batch request
+MAX_BATCH_SHEETS = int(os.environ.get('MAX_BATCH_SHEETS', 100))
+
+def select_batch_sheets(groups, start_char, all_chars, shuffle=True, rng=random):
+    """
+    Select characters for consecutive review sheets, moving the review
+    cursor forward after each sheet the same way the 下一个 filename does
+    Returns (sheets, next_start) where sheets is [(new_chars, start_char, characters)]
+    """
+    sheets = []
+    cursor = start_char
+    for n, new_chars in enumerate(groups, 1):
+        try:
+            selected_chars = select_characters(new_chars, cursor, all_chars)
+        except ValueError as e:
+            raise ValueError(f"Sheet {n} ({new_chars}): {e}") from None
         
-        # Draw cell border
-        c.rect(x, y, cell_width, cell_height)
+        if shuffle:
+            rng.shuffle(selected_chars)
         
-        # Draw character centered in cell
-        try:
-            # For Chinese characters with Helvetica fallback, try to encode properly
-            if font_name == "Helvetica":
-                # Try to draw the character, fallback to placeholder if it fails
-                try:
-                    # Test if character can be encoded
-                    char.encode('latin-1')
-                    text_width = c.stringWidth(char, font_name, font_size)
-                    x_centered = x + (cell_width - text_width) / 2
-                    y_centered = y + cell_height/2 - font_size/3
-                    c.drawString(x_centered, y_centered, char)
-                except UnicodeEncodeError:
-                    # Character can't be encoded in latin-1, draw placeholder
-                    x_centered = x + cell_width/2 - 5
-                    y_centered = y + cell_height/2 - 5
-                    c.setFont("Helvetica", 16)
-                    c.drawString(x_centered, y_centered, "□")
-                    c.setFont(font_name, font_size)  # Reset font
-            else:
-                # Using CID font, should work fine
-                text_width = c.stringWidth(char, font_name, font_size)
-                x_centered = x + (cell_width - text_width) / 2
-                y_centered = y + cell_height/2 - font_size/3
-                c.drawString(x_centered, y_centered, char)
-        except Exception as e:
-            print(f"Error drawing character '{char}': {e}")
-            # Draw a placeholder
-            x_centered = x + cell_width/2 - 5
-            y_centered = y + cell_height/2 - 5
-            c.setFont("Helvetica", 16)
-            c.drawString(x_centered, y_centered, "□")
-            c.setFont(font_name, font_size)  # Reset font
+        sheets.append((new_chars, cursor, selected_chars))
+        cursor = next_review_start(new_chars, cursor, all_chars)
     
-    c.save()
-    return temp_file.name
+    return sheets, cursor
+
+def generate_batch_pdf(sheets):
+    """
+    Render all sheets into one multi-page PDF on a shared canvas
+    Returns a file object positioned at the start of the PDF
+    """
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    with metrics.span('draw'):
+        for n, (_, _, characters) in enumerate(sheets):
+            if n > 0:
+                c.showPage()
+            draw_character_sheet(c, characters)
+    with metrics.span('save'):
+        c.save()
+    return _finish_pdf_buffer(buffer)
+
+def generate_batch_zip(sheets, all_chars):
+    """
+    Render each sheet as its own PDF, named like /generate would, in a ZIP
+    Returns a BytesIO positioned at the start of the archive
+    """
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for n, (new_chars, start_char, characters) in enumerate(sheets, 1):
+            filename = generate_smart_filename(new_chars, start_char, all_chars)
+            with generate_pdf(characters) as pdf_file:
+                archive.writestr(f'{n:02d}_{filename}', pdf_file.read())
+    buffer.seek(0)
+    return buffer
+
+def send_pdf(pdf_file, download_name, etag=None):
+    """Send a generated PDF file object as an attachment; Flask closes it afterwards"""
+    response = send_file(pdf_file, mimetype='application/pdf',
+                         as_attachment=True, download_name=download_name, etag=etag or False)
+    if response.content_length is None:
+        response.content_length = os.fstat(pdf_file.fileno()).st_size
+    return response
+
+_seed_source = random.SystemRandom()
+
+def request_rng(value):
+    """
+    Build the per-request random.Random from an optional seed parameter
+    A fresh seed is drawn when none is given, so every response can echo
+    the seed that reproduces it
+    Returns (seed, rng)
+    """
+    if value is None or str(value).strip() == '':
+        seed = _seed_source.randrange(2 ** 32)
+    else:
+        try:
+            seed = int(str(value).strip())
+        except ValueError:
+            raise ValueError(f"Seed must be an integer, got '{value}'") from None
+    return seed, random.Random(seed)
+
+def with_seed(response, seed):
+    """Echo the request's seed so the output can be regenerated"""
+    response.headers['X-Seed'] = str(seed)
+    return response
+
+def client_seeded(form):
+    """Whether the request supplied its own seed, making a random order repeatable"""
+    return str(form.get('seed', '')).strip() != ''
+
+def send_cached_pdf(inputs, render, download_name, repeatable=True):
+    """
+    Serve a PDF through pdf_result_cache with a strong ETag
+    inputs must fully determine the PDF bytes; render() is only called on
+    a cache miss. Only repeatable requests (no shuffle, or a client seed)
+    are stored, so one-off random orders don't evict PDFs that get reused
+    A matching If-None-Match skips rendering: 304 for GET/HEAD, and 412
+    for the POST routes, as RFC 7232 section 3.2 requires
+    """
+    etag = PdfResultCache.key(inputs)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304 if request.method in ('GET', 'HEAD') else 412)
+        response.set_etag(etag)
+        return response
+    
+    pdf_bytes = pdf_result_cache.get(etag)
+    if pdf_bytes is not None:
+        return send_pdf(BytesIO(pdf_bytes), download_name, etag)
+    
+    pdf_file = render()
+    if repeatable and isinstance(pdf_file, BytesIO):
+        pdf_result_cache.put(etag, pdf_file.getvalue())
+    return send_pdf(pdf_file, download_name, etag)
 
 @app.route('/')
 def index():
@@ -914,15 +2641,88 @@ def index():
         </html>
         """, 500
 
+_characters_payloads = OrderedDict()
+_characters_payloads_lock = threading.Lock()
+
+def characters_payload(all_chars, offset=0, limit=None, gzipped=False):
+    """
+    Serialized /characters body for a snapshot slice, cached per version
+    so repeat requests skip JSON encoding and compression
+    """
+    key = (all_chars.version, offset, limit, gzipped)
+    with _characters_payloads_lock:
+        body = _characters_payloads.get(key)
+        if body is not None:
+            _characters_payloads.move_to_end(key)
+            return body
+    
+    end = len(all_chars) if limit is None else offset + limit
+    body = json.dumps({
+        'characters': str(all_chars[offset:end]),
+        'total': len(all_chars),
+        'offset': offset,
+        'version': all_chars.version,
+    }, ensure_ascii=False).encode('utf-8')
+    if gzipped:
+        body = gzip.compress(body, mtime=0)
+    
+    with _characters_payloads_lock:
+        _characters_payloads[key] = body
+        while len(_characters_payloads) > 16:
+            _characters_payloads.popitem(last=False)
+    return body
+
+def _non_negative_int_arg(name, default):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    if not value.isdigit():
+        raise ValueError(f"'{name}' must be a non-negative integer")
+    return int(value)
+
 @app.route('/characters')
 def get_characters():
-    """Return all characters from data.txt as JSON"""
+    """
+    Return characters from data.txt as JSON
+    Optional offset/limit query parameters return a slice. Responses carry
+    a version-based ETag (If-None-Match gives 304) and are gzipped when
+    the client accepts it
+    """
+    try:
+        offset = _non_negative_int_arg('offset', 0)
+        limit = _non_negative_int_arg('limit', None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
-        all_chars = load_characters()
-        return jsonify({'characters': all_chars})
+        all_chars = character_store.get()
+        gzipped = request.accept_encodings['gzip'] > 0
+        
+        etag = f"{all_chars.version}-{offset}-{'all' if limit is None else limit}"
+        if gzipped:
+            etag += '-gz'
+        
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(characters_payload(all_chars, offset, limit, gzipped),
+                                          mimetype='application/json')
+            if gzipped:
+                response.content_encoding = 'gzip'
+        
+        response.set_etag(etag)
+        # Browsers keep the copy but revalidate it, so they re-download only on a new version
+        response.cache_control.no_cache = True
+        response.vary.add('Accept-Encoding')
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/font-status')
+def get_font_status():
+    """Return which CJK font is registered and whether Helvetica fallback is active"""
+    return jsonify(cjk_fonts.status())
+
 @app.route('/client-ip')
 def get_client_ip():
     """Return the client's IP address"""
@@ -951,28 +2751,17 @@ def add_character():
             return jsonify({'error': 'Only single characters are allowed'}), 400
         
         # Check if it's a valid Chinese character
-        import re
-        chinese_pattern = r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff]'
-        if not re.match(chinese_pattern, char):
+        if filter_chinese_characters(char) != char:
             return jsonify({'error': 'Only Chinese characters are allowed'}), 400
         
-        # Load current characters
-        all_chars = load_characters()
-        
-        # Check if character already exists
-        if char in all_chars:
+        # Append under the inter-process lock; an empty result means another
+        # request (or worker) already added it
+        added = character_store.append(char)
+        if not added:
             return jsonify({'error': f'Character "{char}" already exists in database'}), 400
         
-        # Append character to data.txt
-        import os
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_path = os.path.join(current_dir, 'data.txt')
-        
-        with open(data_path, 'a', encoding='utf-8') as f:
-            f.write(char)
-        
         # Get the new index
-        new_index = len(all_chars)
+        new_index = added[0][1]
         
         return jsonify({
             'success': True, 
@@ -983,91 +2772,623 @@ def add_character():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Upper bound on characters per /characters/lookup request
+MAX_LOOKUP_CHARS = int(os.environ.get('MAX_LOOKUP_CHARS', 5000))
+
+@app.route('/characters/lookup')
+def lookup_characters():
+    """
+    Return the database index of each character in the query (null when
+    not found) and a suggested review start for the new characters, which
+    default to the found query characters
+    """
+    query = request.args.get('q', '')
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    if len(query) > MAX_LOOKUP_CHARS:
+        return jsonify({'error': f'At most {MAX_LOOKUP_CHARS} characters can be looked up at once'}), 400
+    
+    try:
+        all_chars = character_store.get()
+        
+        results = []
+        for char in dict.fromkeys(query):
+            if char.isspace():
+                continue
+            index = all_chars.index(char) if char in all_chars else None
+            results.append({'character': char, 'index': index})
+        
+        new_chars = request.args.get('new_chars', '').strip()
+        if not new_chars:
+            new_chars = ''.join(result['character'] for result in results if result['index'] is not None)
+        
+        review_start = None
+        review_start_error = None
+        if new_chars:
+            try:
+                start_char = suggest_review_start(new_chars, all_chars)
+                if start_char is not None:
+                    review_start = {'character': start_char, 'index': all_chars.index(start_char)}
+            except ValueError as e:
+                review_start_error = str(e)
+        
+        return jsonify({
+            'results': results,
+            'total': len(all_chars),
+            'review_start': review_start,
+            'review_start_error': review_start_error,
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Upper bound on unique characters per /add-characters request
+MAX_BULK_ADD = int(os.environ.get('MAX_BULK_ADD', 5000))
+
+@app.route('/add-characters', methods=['POST'])
+def add_characters():
+    """
+    Add every Chinese character in arbitrary pasted text to the end of data.txt
+    Characters are extracted and deduplicated with filter_chinese_characters
+    and all new ones are written in a single append
+    """
+    try:
+        if request.is_json:
+            data = request.get_json()
+            if not isinstance(data, dict):
+                return jsonify({'error': 'Request body must be a JSON object'}), 400
+            text = data.get('text', '')
+            if not isinstance(text, str):
+                return jsonify({'error': 'text must be a string'}), 400
+        else:
+            text = request.form.get('text', '')
+        
+        # One past the limit is enough to know the request is too large
+        chars = filter_chinese_characters(text, limit=MAX_BULK_ADD + 1)
+        if not chars:
+            return jsonify({'error': 'No Chinese characters found in the text'}), 400
+        if len(chars) > MAX_BULK_ADD:
+            return jsonify({'error': f'At most {MAX_BULK_ADD} characters can be added at once'}), 400
+        
+        added = character_store.append(chars)
+        
+        # Everything is in the index now; report the ones that were already there
+        all_chars = character_store.get()
+        added_set = {char for char, _ in added}
+        existing = [(char, all_chars.index(char)) for char in chars if char not in added_set]
+        
+        return jsonify({
+            'success': True,
+            'message': f'Added {len(added)} new characters, {len(existing)} already in database',
+            'added': [{'character': char, 'index': index} for char, index in added],
+            'existing': [{'character': char, 'index': index} for char, index in existing],
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/generate', methods=['POST'])
 def generate():
     new_chars = request.form['new_chars'].strip()
     start_char = request.form.get('start_char', '').strip()
     shuffle = 'shuffle' in request.form
+    seed_value = request.form.get('seed', '')
+    sheet_style = _sheet_style(request.form)
     
     try:
-        all_chars = load_characters()
-        selected_chars = select_characters(new_chars, start_char, all_chars)
+        seed, rng = request_rng(seed_value)
+        with metrics.span('load'):
+            all_chars = character_store.get()
+        with metrics.span('select'):
+            selected_chars = select_characters(new_chars, start_char, all_chars)
         
         if shuffle:
-            random.shuffle(selected_chars)
-        
-        pdf_path = generate_pdf(selected_chars)
+            rng.shuffle(selected_chars)
         
         # Generate smart filename: new_chars(下一个next_char).pdf
         filename = generate_smart_filename(new_chars, start_char, all_chars)
         
-        return send_file(pdf_path, as_attachment=True, download_name=filename)
+        inputs = ('sheet', ''.join(selected_chars), cjk_fonts.resolve(), sheet_style)
+        render = lambda: generate_sheet_pdf(selected_chars, sheet_style)
+        repeatable = not shuffle or client_seeded(request.form)
+        return with_seed(send_cached_pdf(inputs, render, filename, repeatable), seed)
         
     except ValueError as e:
         # Return to form with error message
         return render_template('index.html', error=str(e), 
-                             new_chars=new_chars, start_char=start_char, 
+                             new_chars=new_chars, start_char=start_char, seed=seed_value,
                              shuffle_checked='checked' if shuffle else '')
 
+@app.route('/generate-batch', methods=['POST'])
+def generate_batch():
+    """
+    Generate consecutive review sheets in one request
+    Accepts a form (groups: one group of new characters per line) or JSON
+    {"groups": [...], "start_char": "...", "shuffle": true, "format": "pdf"|"zip", "seed": 1}
+    """
+    if request.is_json:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        groups = data.get('groups') or []
+        if not isinstance(groups, list) or not all(isinstance(group, str) for group in groups):
+            return jsonify({'error': 'groups must be a list of strings'}), 400
+        start_char = data.get('start_char') or ''
+        if not isinstance(start_char, str):
+            return jsonify({'error': 'start_char must be a string'}), 400
+        start_char = start_char.strip()
+        shuffle = bool(data.get('shuffle', True))
+        output_format = data.get('format', 'pdf')
+        seed_value = data.get('seed')
+    else:
+        groups = request.form.get('groups', '').splitlines()
+        start_char = request.form.get('start_char', '').strip()
+        shuffle = 'shuffle' in request.form
+        output_format = request.form.get('format', 'pdf')
+        seed_value = request.form.get('seed', '')
+    
+    groups = [group.strip() for group in groups if group and group.strip()]
+    
+    try:
+        if not groups:
+            raise ValueError("At least one group of new characters is required")
+        if len(groups) > MAX_BATCH_SHEETS:
+            raise ValueError(f"At most {MAX_BATCH_SHEETS} sheets can be generated at once")
+        
+        seed, rng = request_rng(seed_value)
+        with metrics.span('load'):
+            all_chars = character_store.get()
+        with metrics.span('select'):
+            sheets, next_start = select_batch_sheets(groups, start_char, all_chars, shuffle, rng)
+        
+        if output_format == 'zip':
+            zip_file = generate_batch_zip(sheets, all_chars)
+            return with_seed(send_file(zip_file, mimetype='application/zip', as_attachment=True,
+                                       download_name=f'batch_{len(sheets)}sheets(下一个{next_start}).zip'),
+                             seed)
+        
+        pdf_file = generate_batch_pdf(sheets)
+        return with_seed(send_pdf(pdf_file, f'batch_{len(sheets)}sheets(下一个{next_start}).pdf'), seed)
+        
+    except ValueError as e:
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        # Return to form with error message
+        return render_template('index.html', error=str(e),
+                             batch_groups='\n'.join(groups), batch_start_char=start_char,
+                             batch_seed=seed_value or '',
+                             batch_shuffle_checked='checked' if shuffle else '')
+
+# Upper bound on unique characters per /generate-custom request (100 sheets)
+MAX_CUSTOM_CHARS = int(os.environ.get('MAX_CUSTOM_CHARS', 5000))
+
+def plan_custom_sheet(form):
+    """
+    Parse /generate-custom form fields into (seed, inputs, render, filename)
+    render() produces the PDF; raises ValueError for invalid input
+    """
+    custom_text = form.get('custom_chars', '').strip()
+    shuffle = 'shuffle' in form
+    sheet_style = _sheet_style(form)
+    seed, rng = request_rng(form.get('seed', ''))
+    
+    # Filter and deduplicate Chinese characters
+    with metrics.span('select'):
+        filtered_chars = filter_chinese_characters(custom_text, limit=MAX_CUSTOM_CHARS + 1)
+    
+    if not filtered_chars:
+        raise ValueError("No Chinese characters found in the pasted text")
+    if len(filtered_chars) > MAX_CUSTOM_CHARS:
+        raise ValueError(f"At most {MAX_CUSTOM_CHARS} unique characters can be used at once")
+    
+    # Convert to list for shuffling if needed
+    char_list = list(filtered_chars)
+    
+    if shuffle:
+        rng.shuffle(char_list)
+    
+    # Generate filename with character count
+    char_count = len(char_list)
+    filename = f'chinese_custom_{char_count}chars.pdf'
+    
+    inputs = ('sheet', ''.join(char_list), cjk_fonts.resolve(), sheet_style)
+    return seed, inputs, lambda: generate_sheet_pdf(char_list, sheet_style), filename
+
+# Upper bound on problems per /generate-math request or math job (100 pages)
+MAX_MATH_PROBLEMS = int(os.environ.get('MAX_MATH_PROBLEMS', 600))
+
+def plan_math_sheet(form):
+    """
+    Parse /generate-math form fields into (seed, inputs, render, filename)
+    Raises ValueError for invalid input
+    """
+    problem_type = form.get('problem_type', 'exponential')
+    difficulty = form.get('difficulty', 'medium')
+    value = form.get('num_problems', 6)
+    try:
+        num_problems = int(value)
+    except ValueError:
+        raise ValueError(f"Number of problems must be an integer, got '{value}'") from None
+    if not 1 <= num_problems <= MAX_MATH_PROBLEMS:
+        raise ValueError(f"Number of problems must be between 1 and {MAX_MATH_PROBLEMS}")
+    output_mode = form.get('output_mode', MATH_OUTPUT_MODE)
+    if output_mode not in ('raster', 'vector'):
+        output_mode = MATH_OUTPUT_MODE
+    
+    seed, rng = request_rng(form.get('seed', ''))
+    
+    # Generate problems
+    problems = []
+    if problem_type == 'exponential':
+        with metrics.span('generate'):
+            problems = generate_exponential_problems(difficulty, num_problems, rng)
+    
+    # Generate filename
+    pages = (num_problems + 5) // 6  # Round up to nearest page
+    filename = f'math_exponential_{difficulty}_{num_problems}problems_{pages}pages.pdf'
+    
+    inputs = ('math', tuple(problems), num_problems, output_mode, LATEX_AVAILABLE)
+    return seed, inputs, lambda: generate_math_pdf(problems, num_problems, output_mode), filename
+
 @app.route('/generate-custom', methods=['POST'])
 def generate_custom():
     custom_text = request.form['custom_chars'].strip()
     shuffle = 'shuffle' in request.form
+    seed_value = request.form.get('seed', '')
     
     try:
-        # Filter and deduplicate Chinese characters
-        filtered_chars = filter_chinese_characters(custom_text)
-        
-        if not filtered_chars:
-            raise ValueError("No Chinese characters found in the pasted text")
-        
-        # Convert to list for shuffling if needed
-        char_list = list(filtered_chars)
-        
-        if shuffle:
-            random.shuffle(char_list)
-        
-        pdf_path = generate_pdf(char_list)
-        
-        # Generate filename with character count
-        char_count = len(char_list)
-        filename = f'chinese_custom_{char_count}chars.pdf'
-        
-        return send_file(pdf_path, as_attachment=True, download_name=filename)
+        seed, inputs, render, filename = plan_custom_sheet(request.form)
+        repeatable = not shuffle or client_seeded(request.form)
+        return with_seed(send_cached_pdf(inputs, render, filename, repeatable), seed)
         
     except ValueError as e:
         # Return to form with error message
         return render_template('index.html', error=str(e), 
-                             custom_chars=custom_text,
+                             custom_chars=custom_text, custom_seed=seed_value,
                              custom_shuffle_checked='checked' if shuffle else '')
 
 @app.route('/generate-math', methods=['POST'])
 def generate_math():
-    problem_type = request.form.get('problem_type', 'exponential')
-    difficulty = request.form.get('difficulty', 'medium')
-    num_problems = int(request.form.get('num_problems', 6))
-    
     try:
-        # Generate problems
-        problems = []
-        for _ in range(num_problems):
-            if problem_type == 'exponential':
-                problem, answer = generate_exponential_problem(difficulty)
-                problems.append((problem, answer))
-        
-        # Generate PDF
-        pdf_path = generate_math_pdf(problems, num_problems)
-        
-        # Generate filename
-        pages = (num_problems + 5) // 6  # Round up to nearest page
-        filename = f'math_exponential_{difficulty}_{num_problems}problems_{pages}pages.pdf'
-        
-        return send_file(pdf_path, as_attachment=True, download_name=filename)
+        seed, inputs, render, filename = plan_math_sheet(request.form)
+        # Problems are always random, so only a client seed repeats them
+        return with_seed(send_cached_pdf(inputs, render, filename, client_seeded(request.form)), seed)
         
+    except ValueError as e:
+        return render_template('index.html', error=str(e)), 400
     except Exception as e:
         # Return to form with error message
         return render_template('index.html', error=f"Math generation error: {str(e)}")
 
+# Background job kinds: planner and the form fields a job keeps
+JOB_KINDS = {
+    'custom': (plan_custom_sheet, ('custom_chars', 'shuffle', 'sheet_style')),
+    'math': (plan_math_sheet, ('problem_type', 'difficulty', 'num_problems', 'output_mode')),
+}
+
+class JobQueue:
+    """
+    Background worksheet jobs
+    Jobs are persisted in SQLite and their PDFs written to result_dir, so a
+    restart does not lose them. Each process runs jobs on a thread pool of
+    at most `workers` threads. A job is claimed atomically before it runs,
+    so a job is only rendered once even when several processes share the
+    database. Claims whose process died, or that are older than
+    stale_after seconds, are requeued whenever the queue is used
+    """
+    def __init__(self, db_path, result_dir, workers=2, retention=24 * 3600,
+                 stale_after=3600, recover_interval=30):
+        self.db_path = db_path
+        self.result_dir = result_dir
+        self.workers = workers
+        self.retention = retention
+        self.stale_after = stale_after
+        self.recover_interval = recover_interval
+        self._lock = threading.Lock()
+        self._executor = None
+        self._next_recover = 0
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def _ensure_started(self):
+        """
+        Create the schema and the pool on first use and resume unfinished
+        jobs; afterwards, requeue stale claims every recover_interval seconds
+        """
+        with self._lock:
+            starting = self._executor is None
+            now = time.monotonic()
+            if not starting and now < self._next_recover:
+                return
+            self._next_recover = now + self.recover_interval
+            if starting:
+                os.makedirs(self.result_dir, exist_ok=True)
+                with self._connect() as conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs ("
+                        " id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL,"
+                        " status TEXT NOT NULL, filename TEXT, error TEXT, pid INTEGER,"
+                        " created_at REAL NOT NULL, finished_at REAL, claimed_at REAL)")
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pdf-job')
+        self._recover(starting)
+    
+    def _recover(self, starting=False):
+        """
+        Requeue running jobs whose process died or whose claim is older than
+        stale_after, and queue them here. At startup a claim by this pid is
+        left over from an earlier process, and every waiting job is queued
+        """
+        cutoff = time.time() - self.stale_after
+        with self._connect() as conn:
+            requeued = []
+            for row in conn.execute("SELECT id, pid, claimed_at FROM jobs WHERE status = 'running'").fetchall():
+                stale = (row['claimed_at'] < cutoff or (starting and row['pid'] == os.getpid())
+                         or not _pid_alive(row['pid']))
+                if stale and conn.execute("UPDATE jobs SET status = 'queued', pid = NULL, claimed_at = NULL"
+                                          " WHERE id = ? AND status = 'running' AND claimed_at = ?",
+                                          (row['id'], row['claimed_at'])).rowcount:
+                    requeued.append(row['id'])
+            if starting:
+                requeued = [row['id'] for row in conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+        for job_id in requeued:
+            self._executor.submit(self._run, job_id)
+    
+    def result_path(self, job_id):
+        return os.path.join(self.result_dir, f'{job_id}.pdf')
+    
+    def submit(self, kind, params):
+        """Persist a job and queue it; returns the job id"""
+        self._ensure_started()
+        self.purge()
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                         (job_id, kind, json.dumps(params), time.time()))
+        self._executor.submit(self._run, job_id)
+        return job_id
+    
+    def get(self, job_id):
+        """Return the job as a dict, or None if it does not exist"""
+        self._ensure_started()
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, kind, status, filename, error, created_at, finished_at"
+                               " FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+    
+    def _run(self, job_id):
+        claimed_at = time.time()
+        with self._connect() as conn:
+            claimed = conn.execute("UPDATE jobs SET status = 'running', pid = ?, claimed_at = ?"
+                                   " WHERE id = ? AND status = 'queued'",
+                                   (os.getpid(), claimed_at, job_id)).rowcount
+            if not claimed:
+                return
+            row = conn.execute("SELECT kind, params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        
+        try:
+            with metrics.route_label(f"job_{row['kind']}"):
+                plan, _ = JOB_KINDS[row['kind']]
+                _, _, render, filename = plan(json.loads(row['params']))
+                
+                path = self.result_path(job_id)
+                fd, tmp_path = tempfile.mkstemp(dir=self.result_dir, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as out, render() as pdf_file:
+                        pdf_file.seek(0)
+                        while True:
+                            chunk = pdf_file.read(1 << 20)
+                            if not chunk:
+                                break
+                            out.write(chunk)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+            status, error = 'done', None
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            status, filename, error = 'failed', None, str(e)
+        metrics.inc('jobs_total', kind=row['kind'], status=status)
+        
+        # A claim that went stale and was requeued belongs to the new run now
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, filename = ?, error = ?, finished_at = ?"
+                         " WHERE id = ? AND status = 'running' AND claimed_at = ?",
+                         (status, filename, error, time.time(), job_id, claimed_at))
+    
+    def purge(self):
+        """Delete finished jobs, and their PDFs, older than the retention period"""
+        cutoff = time.time() - self.retention
+        with self._connect() as conn:
+            expired = [row['id'] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        for job_id in expired:
+            try:
+                os.remove(self.result_path(job_id))
+            except FileNotFoundError:
+                pass
+    
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+JOB_DIR = os.environ.get('JOB_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs')
+# Concurrent background renders per worker process
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Seconds before a running job's claim is considered stuck and requeued
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 3600))
+job_queue = JobQueue(os.path.join(JOB_DIR, 'jobs.sqlite3'), JOB_DIR, JOB_WORKERS,
+                     int(os.environ.get('JOB_RETENTION', 24 * 3600)), JOB_STALE_AFTER)
+
+def _job_response(job):
+    body = dict(job)
+    body['status_url'] = f"/jobs/{job['id']}"
+    if job['status'] == 'done':
+        body['download_url'] = f"/jobs/{job['id']}/download"
+    return body
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a /generate-custom (kind=custom) or /generate-math (kind=math)
+    worksheet for background rendering; takes the same form fields
+    """
+    kind = request.form.get('kind', '')
+    if kind not in JOB_KINDS:
+        return jsonify({'error': f"kind must be one of: {', '.join(JOB_KINDS)}"}), 400
+    
+    plan, fields = JOB_KINDS[kind]
+    try:
+        # Validate now and pin the seed so the job renders exactly what was planned
+        seed, _, _, _ = plan(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    params = {field: request.form[field] for field in fields if field in request.form}
+    params['seed'] = str(seed)
+    job_id = job_queue.submit(kind, params)
+    response = jsonify(_job_response(job_queue.get(job_id)))
+    response.status_code = 202
+    response.headers['Location'] = f'/jobs/{job_id}'
+    return with_seed(response, seed)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Return a background job's status"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_job_response(job))
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    """Send a finished background job's PDF"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Job is {job['status']}", 'status': job['status']}), 409
+    try:
+        pdf_file = open(job_queue.result_path(job_id), 'rb')
+    except FileNotFoundError:
+        # Purged by another process or removed from JOB_DIR
+        return jsonify({'error': 'Job result is no longer available', 'status': job['status']}), 410
+    return send_pdf(pdf_file, job['filename'])
+
+def _scrape_gauges():
+    """Cache, spill and font state read at scrape time, in Metrics.render gauge form"""
+    math_cache = math_image_cache.stats()
+    pdf_cache = pdf_result_cache.stats()
+    with _pdf_spill_lock:
+        spill = dict(pdf_spill_stats)
+    gauges = [
+        ('math_image_cache_requests_total', 'counter', 'Math image cache lookups by result',
+         [({'result': 'hit'}, math_cache['hits']), ({'result': 'disk_hit'}, math_cache['disk_hits']),
+          ({'result': 'miss'}, math_cache['misses'])]),
+        ('math_image_cache_entries', 'gauge', 'Rendered expressions held in memory',
+         [({}, math_cache['entries'])]),
+        ('pdf_result_cache_requests_total', 'counter', 'Finished PDF cache lookups by result',
+         [({'result': 'hit'}, pdf_cache['hits']), ({'result': 'miss'}, pdf_cache['misses'])]),
+        ('pdf_result_cache_bytes', 'gauge', 'Bytes of finished PDFs held in memory',
+         [({}, pdf_cache['bytes'])]),
+        ('pdf_spill_files_total', 'counter', 'PDFs spilled to temporary files',
+         [({}, spill['files'])]),
+        ('pdf_spill_bytes_total', 'counter', 'Bytes of PDFs spilled to temporary files',
+         [({}, spill['bytes'])]),
+        ('cjk_font_fallback_active', 'gauge', '1 when character sheets use the Helvetica fallback font',
+         [({}, int(cjk_fonts.fallback_active))]),
+        ('math_rendering_available', 'gauge', '1 when matplotlib math rendering is available',
+         [({}, int(LATEX_AVAILABLE))]),
+    ]
+    if cjk_fonts.embedded_font is not None:
+        subsets = cjk_fonts.embedded_font.stats()
+        gauges.append(('font_subset_cache_requests_total', 'counter', 'Embedded font subset cache lookups by result',
+                       [({'result': 'hit'}, subsets['hits']), ({'result': 'miss'}, subsets['misses'])]))
+    return gauges
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of this worker process's metrics"""
+    return app.response_class(metrics.render(_scrape_gauges()),
+                              content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Problems per difficulty whose expressions warm_up() pre-renders
+WARM_UP_MATH_PROBLEMS = int(os.environ.get('WARM_UP_MATH_PROBLEMS', 30))
+
+def warm_up(math=True, math_problems=None):
+    """
+    Build per-process state before a pre-forking server forks its workers,
+    so the workers share it copy-on-write and their first request runs at
+    steady-state speed
+    Loads the character index, registers the CJK font, and with math set
+    loads matplotlib and pre-renders a fixed-seed sample of expressions from
+    every difficulty into the image and vector layout caches. Everything
+    runs serially on this thread: no render pool or job worker is started,
+    since neither survives a fork. Ends with gc.freeze() so the collector
+    doesn't dirty the shared pages
+    Returns {stage: seconds}
+    """
+    math_problems = WARM_UP_MATH_PROBLEMS if math_problems is None else math_problems
+    timings = {}
+    
+    with metrics.route_label('warm_up'):
+        start = time.perf_counter()
+        chars = load_characters()
+        timings['characters'] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        cjk_fonts.resolve()
+        # A first sheet loads the CID width tables and reportlab's lazy imports
+        with generate_pdf(list(chars[:50])):
+            pass
+        timings['fonts'] = time.perf_counter() - start
+        
+        if math and load_math_stack():
+            start = time.perf_counter()
+            rng = random.Random(0)
+            sample = []
+            for difficulty in ('easy', 'medium', 'hard'):
+                problems = generate_exponential_problems(difficulty, math_problems, rng)
+                sample.extend(problems)
+                for problem, answer in problems:
+                    for expression, add_question_mark in ((problem, True), (answer, False)):
+                        expression = format_math_problem_for_display(expression)
+                        render_math_png(expression, add_question_mark=add_question_mark)
+                        math_vector_layout(expression, add_question_mark=add_question_mark)
+            # Every expression is cached now, so this never reaches the render pool
+            for output_mode in ('raster', 'vector') if sample else ():
+                with generate_math_pdf(sample[:6], min(6, len(sample)), output_mode):
+                    pass
+            timings['math'] = time.perf_counter() - start
+    
+    gc.collect()
+    gc.freeze()
+    return timings
+
+@app.cli.command('compile-characters')
+def compile_characters_command():
+    """Build data.bin, the memory-mapped form of data.txt"""
+    text_path = character_store.resolve_path()
+    db_path = compile_character_db(text_path)
+    print(f"Compiled {text_path} -> {db_path}")
+
 @app.route('/sswpa-test/')
 def sswpa_test():
     """Serve the SSWPA test website"""
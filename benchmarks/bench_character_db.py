@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compare loading and index lookups of data.txt as a dict-backed
+CharacterIndex against the memory-mapped compiled database.
+
+Usage:
+    python benchmarks/bench_character_db.py [--chars 120000] [--lookups 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CharacterStore, compile_character_db
+
+
+def build_database(path, num_chars, seed):
+    # CJK Unified Ideographs plus Extension B, so the database spans planes
+    pool = [chr(cp) for cp in range(0x4E00, 0xA000)] + [chr(cp) for cp in range(0x20000, 0x2A6E0)]
+    random.Random(seed).shuffle(pool)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(pool[:num_chars]))
+
+
+def measure_load(path, compiled):
+    tracemalloc.start()
+    start = time.perf_counter()
+    chars = CharacterStore(path, check_interval=0, compiled=compiled).get()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return chars, elapsed, peak
+
+
+def measure_lookups(chars, queries):
+    start = time.perf_counter()
+    for char in queries:
+        chars.index(char)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chars', type=int, default=120000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'data.txt')
+        build_database(path, args.chars, args.seed)
+        compile_character_db(path)
+        
+        rng = random.Random(args.seed)
+        for label, compiled in (('data.txt dict', False), ('data.bin mmap', True)):
+            chars, load_time, peak = measure_load(path, compiled)
+            queries = [chars[rng.randrange(len(chars))] for _ in range(args.lookups)]
+            lookup_time = measure_lookups(chars, queries)
+            print(f"{label:14s} load {load_time * 1000:8.1f} ms  "
+                  f"peak {peak / 1024 / 1024:6.1f} MiB  "
+                  f"lookup {lookup_time / args.lookups * 1e6:6.2f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compare filter_chinese_characters against the previous re.findall plus
+ordered-dedupe implementation on multi-megabyte pasted text, and on text
+made entirely of distinct ideographs (a pasted character list).
+
+Usage:
+    python benchmarks/bench_filter_characters.py [--megabytes 5] [--unique 60000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CJK_RANGES, filter_chinese_characters
+
+
+def findall_filter(text):
+    """The previous implementation, extended to the same ranges"""
+    pattern = '[' + ''.join(f'{chr(first)}-{chr(last)}' for first, last in CJK_RANGES) + ']'
+    unique_chars = []
+    seen = set()
+    for char in re.findall(pattern, text):
+        if char not in seen:
+            unique_chars.append(char)
+            seen.add(char)
+    return ''.join(unique_chars)
+
+
+def build_text(megabytes, seed):
+    # Common characters with a Zipf-like skew, a few astral ones, and punctuation
+    rng = random.Random(seed)
+    common = [chr(cp) for cp in range(0x4E00, 0x4E00 + 3500)]
+    rare = [chr(cp) for cp in range(0x20000, 0x20000 + 200)]
+    weights = [1 / (rank + 1) for rank in range(len(common))]
+    pieces = []
+    size = 0
+    while size < megabytes * 1_000_000:
+        sentence = ''.join(rng.choices(common, weights, k=rng.randint(5, 30)))
+        if rng.random() < 0.05:
+            sentence += rng.choice(rare)
+        sentence += rng.choice('，。！？\n') + rng.choice(['', ' ', 'abc ', '123'])
+        pieces.append(sentence)
+        size += len(sentence.encode('utf-8'))
+    return ''.join(pieces)
+
+
+def build_unique_text(count):
+    # Every character appears once, so every part is full of new characters
+    code_points = [cp for first, last in CJK_RANGES for cp in range(first, last + 1)]
+    return ''.join(map(chr, code_points[:count]))
+
+
+def measure(func, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, statistics.median(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--megabytes', type=float, default=5)
+    parser.add_argument('--unique', type=int, default=60000, help='distinct ideographs in the second text')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    cases = [
+        ('re.findall + dedupe', findall_filter),
+        ('streaming', filter_chinese_characters),
+        ('streaming, limit=500', lambda t: filter_chinese_characters(t, limit=500)),
+        ('streaming, limit=5001', lambda t: filter_chinese_characters(t, limit=5001)),
+    ]
+    texts = [
+        ('pasted text', build_text(args.megabytes, args.seed)),
+        ('all unique', build_unique_text(args.unique)),
+    ]
+    for name, text in texts:
+        print(f"\n{name}: {len(text.encode('utf-8')) / 1e6:.1f} MB, {len(text)} characters")
+        expected = None
+        for label, func in cases:
+            result, elapsed, peak = measure(func, text, args.repeat)
+            if expected is None:
+                expected = result
+            assert result == expected[:len(result)], label
+            print(f"{label:22s} {elapsed * 1000:8.1f} ms  peak {peak / 1024 / 1024:7.1f} MiB  "
+                  f"{len(result)} unique")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare per-expression latency of the legacy pyplot renderer against the
+figure-free mathtext renderer used by render_math_latex.
+
+Usage:
+    python benchmarks/bench_math_render.py [--problems 60] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (LATEX_AVAILABLE, format_math_problem_for_display,
+                 generate_exponential_problem, render_math_latex_pyplot,
+                 render_math_mathtext)
+
+
+def build_expressions(num_problems, seed):
+    rng = random.Random(seed)
+    expressions = []
+    for difficulty in ('easy', 'medium', 'hard'):
+        for _ in range(num_problems // 3):
+            problem, answer = generate_exponential_problem(difficulty, rng)
+            expressions.append((format_math_problem_for_display(problem), True))
+            expressions.append((format_math_problem_for_display(answer), False))
+    return expressions
+
+
+def time_renderer(render, expressions, repeat):
+    timings = []
+    for _ in range(repeat):
+        for expression, add_question_mark in expressions:
+            start = time.perf_counter()
+            render(expression, add_question_mark=add_question_mark)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p50 = statistics.median(timings) * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    mean = statistics.fmean(timings) * 1000
+    print(f"{name:<10} n={len(timings):<5} mean={mean:7.2f}ms  p50={p50:7.2f}ms  p99={p99:7.2f}ms")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--problems', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    if not LATEX_AVAILABLE:
+        sys.exit("matplotlib/PIL not installed")
+    
+    expressions = build_expressions(args.problems, args.seed)
+    
+    # Warm up font loading for both paths so the first call isn't counted
+    render_math_latex_pyplot('2^{3}')
+    render_math_mathtext('2^{3}')
+    
+    pyplot_mean = report('pyplot', time_renderer(render_math_latex_pyplot, expressions, args.repeat))
+    mathtext_mean = report('mathtext', time_renderer(render_math_mathtext, expressions, args.repeat))
+    print(f"speedup: {pyplot_mean / mathtext_mean:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Compare generating a problem bank one problem at a time against the
+NumPy batch generator.
+
+Usage:
+    python benchmarks/bench_problem_generation.py [--problems 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import generate_exponential_problem, generate_exponential_problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--problems', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    cases = [
+        ('loop', lambda difficulty, rng: [generate_exponential_problem(difficulty, rng)
+                                          for _ in range(args.problems)]),
+        ('batch', lambda difficulty, rng: generate_exponential_problems(difficulty, args.problems, rng)),
+    ]
+    for difficulty in ('easy', 'medium', 'hard'):
+        for label, func in cases:
+            times = []
+            for i in range(args.repeat):
+                rng = random.Random(args.seed + i)
+                start = time.perf_counter()
+                func(difficulty, rng)
+                times.append(time.perf_counter() - start)
+            elapsed = statistics.median(times)
+            print(f"{difficulty:6s} {label:5s} {elapsed * 1000:8.1f} ms  "
+                  f"{args.problems / elapsed:10.0f} problems/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Measure cold start of the WSGI entry point: how long `import wsgi` takes
+in a fresh interpreter, and the latency of the first and second request
+to each route. Every sample runs in a new process, the way a worker
+starts after a reload.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat 5] [--importtime] [--warm-up]
+
+With --warm-up the children run wsgi.py with WARM_UP=1, so the import time
+includes warm_up() and the first request shows what a forked worker sees.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside each fresh interpreter; prints one JSON line
+CHILD = r'''
+import json, sys, time
+sys.path.insert(0, {root!r})
+heavy = ('matplotlib', 'numpy')
+
+start = time.perf_counter()
+import wsgi
+import_ms = (time.perf_counter() - start) * 1000
+loaded_at_import = [name for name in heavy if name in sys.modules]
+
+app_module = sys.modules['app']
+client = wsgi.application.test_client()
+chars = app_module.load_characters()
+requests = {{
+    'index': lambda: client.get('/'),
+    'characters': lambda: client.get('/characters'),
+    'generate': lambda: client.post('/generate', data={{'new_chars': chars[60:63], 'start_char': chars[30], 'seed': '1'}}),
+    'generate_math': lambda: client.post('/generate-math', data={{'num_problems': '6', 'seed': '1'}}),
+}}
+send = requests[{route!r}]
+
+timings = []
+for _ in range(2):
+    app_module.pdf_result_cache.clear()
+    start = time.perf_counter()
+    response = send()
+    response.get_data()
+    timings.append((time.perf_counter() - start) * 1000)
+
+print(json.dumps({{
+    'import_ms': import_ms,
+    'first_ms': timings[0],
+    'second_ms': timings[1],
+    'status': response.status_code,
+    'heavy_at_import': loaded_at_import,
+    'heavy_after_request': [name for name in heavy if name in sys.modules],
+}}))
+'''
+
+ROUTES = ('index', 'characters', 'generate', 'generate_math')
+
+
+def run_child(route, warm_up=False):
+    env = dict(os.environ, WARM_UP='1' if warm_up else '0')
+    output = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT, route=route)],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def show_importtime():
+    """Print the slowest cumulative imports of `import wsgi` from -X importtime"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import sys; sys.path.insert(0, {ROOT!r}); import wsgi'],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        rows.append((int(cumulative_us), name.rstrip()))
+    print("\nSlowest imports (cumulative ms):")
+    for cumulative_us, name in sorted(rows, reverse=True)[:15]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='fresh processes per route')
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--warm-up', action='store_true', help='run warm_up() at import, as a preloading master would')
+    args = parser.parse_args()
+
+    print(f"{'route':15s} {'import ms':>10s} {'1st req ms':>11s} {'2nd req ms':>11s}  heavy modules")
+    for route in ROUTES:
+        samples = [run_child(route, args.warm_up) for _ in range(args.repeat)]
+        median = {key: statistics.median(sample[key] for sample in samples)
+                  for key in ('import_ms', 'first_ms', 'second_ms')}
+        last = samples[-1]
+        heavy = (f"import: {','.join(last['heavy_at_import']) or '-'}; "
+                 f"after request: {','.join(last['heavy_after_request']) or '-'}")
+        print(f"{route:15s} {median['import_ms']:10.1f} {median['first_ms']:11.1f} "
+              f"{median['second_ms']:11.1f}  {heavy}")
+
+    if args.importtime:
+        show_importtime()
+
+
+if __name__ == '__main__':
+    main()
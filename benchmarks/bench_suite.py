@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the generation hot paths at several scales.
+
+Each case reports ops/sec, p50/p99 latency and peak traced memory. Results
+can be saved as a JSON baseline, and a later run compared against it;
+the run fails (exit status 1) when a case's p50 latency or peak memory
+grows by more than the threshold.
+
+Usage:
+    python benchmarks/bench_suite.py [--quick] [--filter select] [--min-time 1.0]
+    python benchmarks/bench_suite.py --save benchmarks/baseline.json
+    python benchmarks/bench_suite.py --baseline benchmarks/baseline.json [--threshold 0.25]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from app import (CharacterIndex, LATEX_AVAILABLE, convert_to_latex_math, filter_chinese_characters,
+                 format_math_problem_for_display, generate_exponential_problems, generate_math_pdf,
+                 generate_pdf, render_math_latex, select_characters)
+
+
+def character_pool(size, seed=0):
+    # Unified ideographs first, then Extension B, so large databases span planes
+    pool = [chr(cp) for cp in range(0x4E00, 0xA000)] + [chr(cp) for cp in range(0x20000, 0x2A6E0)]
+    random.Random(seed).shuffle(pool)
+    return ''.join(pool[:size])
+
+
+def pasted_text(size_bytes, seed=0):
+    rng = random.Random(seed)
+    common = character_pool(3500, seed)
+    pieces = []
+    size = 0
+    while size < size_bytes:
+        sentence = ''.join(rng.choices(common, k=rng.randint(5, 30))) + rng.choice('，。！？\n') + rng.choice(['', 'abc ', '12 '])
+        pieces.append(sentence)
+        size += len(sentence.encode('utf-8'))
+    return ''.join(pieces)
+
+
+def math_expressions(count, difficulty='hard', seed=0):
+    problems = generate_exponential_problems(difficulty, count, random.Random(seed))
+    return [format_math_problem_for_display(problem) for problem, _ in problems]
+
+
+# Each case builder returns (run, setup); setup runs before every timed call
+# and is excluded from the measurement
+
+def case_select_characters(db_size):
+    all_chars = CharacterIndex(character_pool(db_size))
+    rng = random.Random(db_size)
+
+    def run():
+        first_new = rng.randrange(60, len(all_chars) - 10)
+        new_chars = all_chars[first_new:first_new + 10]
+        start_char = all_chars[rng.randrange(0, first_new)]
+        select_characters(new_chars, start_char, all_chars)
+    return run, None
+
+
+def case_filter_chinese_characters(size_bytes):
+    text = pasted_text(size_bytes)
+    return (lambda: filter_chinese_characters(text)), None
+
+
+def case_convert_to_latex_math(count):
+    expressions = math_expressions(count)
+
+    def run():
+        for expression in expressions:
+            convert_to_latex_math(expression)
+    return run, None
+
+
+def case_render_math_latex(difficulty):
+    expressions = math_expressions(200, difficulty)
+    rng = random.Random(1)
+    return (lambda: render_math_latex(rng.choice(expressions))), None
+
+
+def case_generate_pdf(num_chars):
+    chars = list(character_pool(num_chars))
+
+    def run():
+        with generate_pdf(chars):
+            pass
+    return run, None
+
+
+def case_generate_math_pdf(num_problems, output_mode):
+    rng = random.Random(num_problems)
+    state = {}
+
+    def setup():
+        # Cold caches: every run renders its expressions from scratch
+        app.math_image_cache.clear()
+        app.math_vector_layout.cache_clear()
+        app.pdf_result_cache.clear()
+        state['problems'] = generate_exponential_problems('hard', num_problems, rng)
+
+    def run():
+        with generate_math_pdf(state['problems'], num_problems, output_mode):
+            pass
+    return run, setup
+
+
+# (case name, scale label, builder, args, included in --quick, needs matplotlib)
+CASES = [
+    ('select_characters', 'db=2k', case_select_characters, (2000,), True, False),
+    ('select_characters', 'db=20k', case_select_characters, (20000,), True, False),
+    ('select_characters', 'db=100k', case_select_characters, (100000,), False, False),
+    ('filter_chinese_characters', 'text=10KB', case_filter_chinese_characters, (10_000,), True, False),
+    ('filter_chinese_characters', 'text=1MB', case_filter_chinese_characters, (1_000_000,), True, False),
+    ('filter_chinese_characters', 'text=5MB', case_filter_chinese_characters, (5_000_000,), False, False),
+    ('convert_to_latex_math', 'exprs=100', case_convert_to_latex_math, (100,), True, True),
+    ('convert_to_latex_math', 'exprs=1000', case_convert_to_latex_math, (1000,), False, True),
+    ('render_math_latex', 'easy', case_render_math_latex, ('easy',), True, True),
+    ('render_math_latex', 'hard', case_render_math_latex, ('hard',), False, True),
+    ('generate_pdf', 'chars=50', case_generate_pdf, (50,), True, False),
+    ('generate_pdf', 'chars=500', case_generate_pdf, (500,), False, False),
+    ('generate_math_pdf', 'problems=6,raster', case_generate_math_pdf, (6, 'raster'), True, True),
+    ('generate_math_pdf', 'problems=6,vector', case_generate_math_pdf, (6, 'vector'), True, True),
+    ('generate_math_pdf', 'problems=60,raster', case_generate_math_pdf, (60, 'raster'), False, True),
+    ('generate_math_pdf', 'problems=60,vector', case_generate_math_pdf, (60, 'vector'), False, True),
+]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def calibrate(run, sample_time=0.001):
+    """Calls per timed sample, so fast operations are not dominated by timer overhead"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        if time.perf_counter() - start >= sample_time:
+            return number
+        number *= 2
+
+
+def measure(run, setup, min_time, min_runs, max_runs):
+    """
+    Time run() until min_time has elapsed, then trace one extra call for
+    peak memory. Cases without setup are timed in batches of calls;
+    latencies are per call
+    """
+    if setup:
+        setup()
+    run()  # Warm-up: imports, font registration, first-use caches
+    number = 1 if setup else calibrate(run)
+
+    latencies = []
+    total = 0.0
+    while len(latencies) < max_runs and (len(latencies) < min_runs or total < min_time):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed / number)
+        total += elapsed
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'runs': len(latencies) * number,
+        'ops_per_sec': len(latencies) * number / total,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a description of every case that regressed past the threshold"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'peak_kib'):
+            if previous[metric] > 0 and current[metric] > previous[metric] * (1 + threshold):
+                change = current[metric] / previous[metric] - 1
+                regressions.append(f"{key} {metric}: {previous[metric]:.3f} -> {current[metric]:.3f} (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='only the small scales')
+    parser.add_argument('--filter', default='', help='only cases whose name contains this')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds to spend per case')
+    parser.add_argument('--min-runs', type=int, default=5)
+    parser.add_argument('--max-runs', type=int, default=10000)
+    parser.add_argument('--save', metavar='PATH', help='write results as a JSON baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed relative growth of p50 latency and peak memory (default 0.25)')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':45s} {'ops/s':>10s} {'p50 ms':>10s} {'p99 ms':>10s} {'peak KiB':>10s}")
+    for name, scale, builder, builder_args, quick, needs_matplotlib in CASES:
+        if args.quick and not quick:
+            continue
+        if args.filter not in name:
+            continue
+        key = f'{name}[{scale}]'
+        if needs_matplotlib and not LATEX_AVAILABLE:
+            print(f"{key:45s} skipped (matplotlib not available)")
+            continue
+
+        run, setup = builder(*builder_args)
+        result = measure(run, setup, args.min_time, args.min_runs, args.max_runs)
+        results[key] = result
+        print(f"{key:45s} {result['ops_per_sec']:10.1f} {result['p50_ms']:10.3f} "
+              f"{result['p99_ms']:10.3f} {result['peak_kib']:10.1f}")
+
+    app._reset_math_render_pool()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpu_count': os.cpu_count(),
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
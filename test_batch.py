@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import zipfile
+from io import BytesIO
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import (select_batch_sheets, select_characters, next_review_start,
+                 load_characters)
+
+
+class TestBatchSheets(unittest.TestCase):
+    
+    def setUp(self):
+        self.all_chars = load_characters()
+        self.client = app.app.test_client()
+        self.groups = [self.all_chars[300:303], self.all_chars[303:305]]
+        self.start_char = self.all_chars[200]
+    
+    def test_cursor_advances_between_sheets(self):
+        """Each sheet starts review where the previous sheet's 下一个 points"""
+        sheets, next_start = select_batch_sheets(self.groups, self.start_char,
+                                                 self.all_chars, shuffle=False)
+        
+        self.assertEqual(len(sheets), 2)
+        self.assertEqual(sheets[0][1], self.start_char)
+        
+        second_start = next_review_start(self.groups[0], self.start_char, self.all_chars)
+        self.assertEqual(sheets[1][1], second_start)
+        self.assertEqual(sheets[1][2], select_characters(self.groups[1], second_start, self.all_chars))
+        self.assertEqual(next_start, next_review_start(self.groups[1], second_start, self.all_chars))
+    
+    def test_invalid_group_names_sheet(self):
+        """Validation errors say which sheet failed"""
+        with self.assertRaises(ValueError) as context:
+            select_batch_sheets([self.groups[0], '🚀'], self.start_char, self.all_chars)
+        self.assertIn("Sheet 2", str(context.exception))
+    
+    def test_batch_pdf_route(self):
+        """JSON requests return one PDF with a page per sheet"""
+        response = self.client.post('/generate-batch', json={
+            'groups': self.groups, 'start_char': self.start_char, 'shuffle': False})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertEqual(response.data.count(b'/Type /Page\n'), 2)
+    
+    def test_batch_zip_route(self):
+        """Form requests can ask for a ZIP of per-sheet PDFs"""
+        response = self.client.post('/generate-batch', data={
+            'groups': '\n'.join(self.groups), 'start_char': self.start_char, 'format': 'zip'})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(response.data)) as archive:
+            names = archive.namelist()
+        self.assertEqual(len(names), 2)
+        self.assertTrue(names[0].startswith('01_' + self.groups[0]))
+    
+    def test_batch_error_json(self):
+        """JSON requests get errors back as JSON"""
+        response = self.client.post('/generate-batch', json={'groups': [], 'start_char': self.start_char})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.get_json())
+    
+    def test_batch_rejects_malformed_json(self):
+        """Non-object bodies and non-list groups are 400s, not 500s"""
+        for body in ([self.groups[0]], {'groups': self.groups[0], 'start_char': self.start_char},
+                     {'groups': [1, 2], 'start_char': self.start_char}, {'groups': self.groups, 'start_char': 5}):
+            with self.subTest(body=body):
+                response = self.client.post('/generate-batch', json=body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,185 @@
+import unittest
+import sys
+import os
+import tempfile
+import threading
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import (CharacterStore, CharacterIndex, compile_character_db, compiled_db_path,
+                 load_character_db, select_characters)
+
+
+class TestCharacterStore(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        self.write('上下边毛中')
+        self.store = CharacterStore(self.path, check_interval=0)
+
+    def tearDown(self):
+        os.remove(self.path)
+        if os.path.exists(self.path + '.lock'):
+            os.remove(self.path + '.lock')
+
+    def write(self, text):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def test_index_lookup(self):
+        """Lookups come from the char -> index map"""
+        chars = self.store.get()
+        self.assertIsInstance(chars, CharacterIndex)
+        self.assertEqual(chars, '上下边毛中')
+        self.assertEqual(chars.index('毛'), 3)
+        self.assertIn('中', chars)
+        self.assertNotIn('🚀', chars)
+        with self.assertRaises(ValueError):
+            chars.index('🚀')
+
+    def test_cached_until_file_changes(self):
+        """The same object is returned until data.txt changes"""
+        first = self.store.get()
+        self.assertIs(self.store.get(), first)
+
+        self.write('上下边毛中颗')
+        second = self.store.get()
+        self.assertIsNot(second, first)
+        self.assertEqual(second.index('颗'), 5)
+
+    def test_check_interval(self):
+        """Within check_interval the file is not re-checked"""
+        store = CharacterStore(self.path, check_interval=3600)
+        first = store.get()
+        self.write('上下边毛中颗')
+        self.assertIs(store.get(), first)
+        store.invalidate()
+        self.assertEqual(store.get(), '上下边毛中颗')
+
+    def test_missing_file(self):
+        """A missing data file raises FileNotFoundError"""
+        store = CharacterStore(self.path + '.missing')
+        with self.assertRaises(FileNotFoundError):
+            store.get()
+
+    def test_append_returns_indices(self):
+        """New characters are appended once and get consecutive indices"""
+        added = self.store.append('颗中一颗间')
+        self.assertEqual(added, [('颗', 5), ('一', 6), ('间', 7)])
+        self.assertEqual(self.store.append('颗'), [])
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), '上下边毛中颗一间')
+
+    def test_other_store_updates_incrementally(self):
+        """Another worker's store picks up appends without a full re-read"""
+        other = CharacterStore(self.path, check_interval=0)
+        before = other.get()
+        self.store.append('颗一')
+
+        after = other.get()
+        self.assertEqual(after, '上下边毛中颗一')
+        self.assertIs(after.positions, before.positions)
+        self.assertEqual(after.index('一'), 6)
+        # Older snapshots don't see characters past their own length
+        self.assertNotIn('一', before)
+
+    def test_incremental_matches_fresh_load(self):
+        """Appends across whitespace at the old end of file index like a full load"""
+        for start, tail in [('一二\n', '三\n四'), ('一二\u3000', '三 '), ('\n', '\n三'), ('一二', '\n\n三\n')]:
+            for compiled in (False, True):
+                with self.subTest(start=start, tail=tail, compiled=compiled):
+                    self.write(start)
+                    store = CharacterStore(self.path, check_interval=0, compiled=compiled)
+                    store.get()
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(tail)
+                    fresh = CharacterStore(self.path, check_interval=0, compiled=False).get()
+                    self.assertEqual(store.get(), fresh)
+                    self.assertEqual(store.get(), (start + tail).strip())
+                    if os.path.exists(compiled_db_path(self.path)):
+                        os.remove(compiled_db_path(self.path))
+
+    def test_append_after_trailing_newline(self):
+        """Our own appends keep whitespace that is no longer at the end of file"""
+        self.write('一二\n')
+        self.assertEqual(self.store.append('三'), [('三', 3)])
+        self.assertEqual(self.store.get(), CharacterStore(self.path, check_interval=0).get())
+        self.assertEqual(self.store.get(), '一二\n三')
+
+    def test_concurrent_appends_do_not_duplicate(self):
+        """Parallel appends of the same characters through separate stores stay unique"""
+        chars = ''.join(chr(0x4e00 + i) for i in range(40))
+        stores = [CharacterStore(self.path, check_interval=0) for _ in range(8)]
+        threads = [threading.Thread(target=store.append, args=(chars,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with open(self.path, encoding='utf-8') as f:
+            data = f.read()
+        self.assertEqual(len(data), len(set(data)))
+        self.assertEqual(self.store.get().index(chars[-1]), len(data) - 1)
+
+    def test_select_characters_accepts_plain_string(self):
+        """select_characters still works when given a plain string"""
+        all_chars = ''.join(chr(0x4e00 + i) for i in range(120))
+        result = select_characters(all_chars[60:62], all_chars[10], all_chars)
+        self.assertEqual(len(result), 50)
+        self.assertEqual(result[2], all_chars[10])
+
+
+class TestCompiledCharacterDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'data.txt')
+        self.write('上下边毛中上𠀀')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, text):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def test_round_trip(self):
+        """The mapped database matches the text one, first occurrence wins"""
+        db_path = compile_character_db(self.path)
+        self.assertEqual(db_path, compiled_db_path(self.path))
+        chars = load_character_db(db_path)
+        self.assertEqual(chars, '上下边毛中上𠀀')
+        self.assertEqual(chars.index('上'), 0)
+        self.assertEqual(chars.index('𠀀'), 6)
+        self.assertNotIn('黑', chars)
+
+    def test_store_uses_existing_compiled_db(self):
+        """A compiled database is used once it exists and rebuilt when stale"""
+        compile_character_db(self.path)
+        store = CharacterStore(self.path, check_interval=0)
+        self.assertNotIsInstance(store.get().positions, dict)
+
+        self.write('黑白')
+        os.utime(self.path, ns=(0, 0))
+        chars = CharacterStore(self.path, check_interval=0).get()
+        self.assertEqual(chars, '黑白')
+        self.assertEqual(load_character_db(compiled_db_path(self.path)), '黑白')
+
+    def test_appends_on_mapped_index(self):
+        """Appends after a mapped load are visible without a rebuild"""
+        store = CharacterStore(self.path, check_interval=0, compiled=True)
+        store.get()
+        self.assertEqual(store.append('毛黑'), [('黑', 7)])
+        self.assertEqual(store.get().index('黑'), 7)
+        self.assertEqual(CharacterStore(self.path, check_interval=0, compiled=True).get().index('黑'), 7)
+
+    def test_disabled(self):
+        """compiled=False never builds or reads data.bin"""
+        CharacterStore(self.path, check_interval=0, compiled=False).get()
+        self.assertFalse(os.path.exists(compiled_db_path(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
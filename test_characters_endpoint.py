@@ -0,0 +1,168 @@
+import unittest
+import sys
+import os
+import gzip
+import json
+import tempfile
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import CharacterStore, suggest_review_start
+
+
+class TestCharactersEndpoint(unittest.TestCase):
+    
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('上下边毛中颗一间')
+        self.original_store = app.character_store
+        app.character_store = CharacterStore(self.path, check_interval=0)
+        self.client = app.app.test_client()
+    
+    def tearDown(self):
+        app.character_store = self.original_store
+        os.remove(self.path)
+        if os.path.exists(self.path + '.lock'):
+            os.remove(self.path + '.lock')
+    
+    def test_full_payload(self):
+        """Without parameters the whole database is returned"""
+        data = self.client.get('/characters').get_json()
+        self.assertEqual(data['characters'], '上下边毛中颗一间')
+        self.assertEqual(data['total'], 8)
+    
+    def test_offset_limit(self):
+        """offset/limit return a slice with the total for paging"""
+        data = self.client.get('/characters?offset=2&limit=3').get_json()
+        self.assertEqual(data['characters'], '边毛中')
+        self.assertEqual(data['offset'], 2)
+        self.assertEqual(data['total'], 8)
+        
+        self.assertEqual(self.client.get('/characters?limit=-1').status_code, 400)
+    
+    def test_etag_and_304(self):
+        """Unchanged versions revalidate with 304; appends change the ETag"""
+        first = self.client.get('/characters')
+        etag = first.get_etag()[0]
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+        
+        cached = self.client.get('/characters', headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(cached.status_code, 304)
+        
+        app.character_store.append('黑')
+        changed = self.client.get('/characters', headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.get_etag()[0], etag)
+    
+    def test_gzip(self):
+        """Clients that accept gzip get a compressed body"""
+        response = self.client.get('/characters', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.content_encoding, 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        data = json.loads(gzip.decompress(response.data))
+        self.assertEqual(data['characters'], '上下边毛中颗一间')
+
+
+class TestCharactersLookup(unittest.TestCase):
+    
+    def setUp(self):
+        self.all_chars = ''.join(chr(0x4e00 + i) for i in range(100))
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(self.all_chars)
+        self.original_store = app.character_store
+        app.character_store = CharacterStore(self.path, check_interval=0)
+        self.client = app.app.test_client()
+    
+    def tearDown(self):
+        app.character_store = self.original_store
+        os.remove(self.path)
+    
+    def test_suggest_review_start(self):
+        """The suggestion is the character before the earliest new one"""
+        new_chars = self.all_chars[60] + self.all_chars[55]
+        self.assertEqual(suggest_review_start(new_chars, self.all_chars), self.all_chars[54])
+        self.assertIsNone(suggest_review_start(self.all_chars[50:100], self.all_chars))
+        with self.assertRaises(ValueError):
+            suggest_review_start(self.all_chars[10], self.all_chars)
+    
+    def test_lookup_indices(self):
+        """Each queried character gets its index, or null when missing"""
+        query = self.all_chars[70] + '黑' + self.all_chars[3]
+        data = self.client.get('/characters/lookup', query_string={'q': query}).get_json()
+        self.assertEqual(data['results'], [
+            {'character': self.all_chars[70], 'index': 70},
+            {'character': '黑', 'index': None},
+            {'character': self.all_chars[3], 'index': 3},
+        ])
+        # Index 3 is too early to be a new character, so no start can be suggested
+        self.assertIsNone(data['review_start'])
+        self.assertIn('indices > 50', data['review_start_error'])
+    
+    def test_lookup_suggests_start_for_new_chars(self):
+        """new_chars overrides the query when choosing the review start"""
+        data = self.client.get('/characters/lookup', query_string={
+            'q': self.all_chars[3],
+            'new_chars': self.all_chars[80] + self.all_chars[75],
+        }).get_json()
+        self.assertEqual(data['review_start'], {'character': self.all_chars[74], 'index': 74})
+        self.assertEqual(self.client.get('/characters/lookup').status_code, 400)
+
+
+class TestAddCharactersRoute(unittest.TestCase):
+    
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('上下边毛中')
+        self.original_store = app.character_store
+        app.character_store = CharacterStore(self.path, check_interval=0)
+        self.client = app.app.test_client()
+    
+    def tearDown(self):
+        app.character_store = self.original_store
+        os.remove(self.path)
+        if os.path.exists(self.path + '.lock'):
+            os.remove(self.path + '.lock')
+    
+    def test_bulk_add_from_pasted_text(self):
+        """Pasted text is filtered, deduplicated and appended in one write"""
+        response = self.client.post('/add-characters', json={'text': 'Hello 上颗, 颗一! abc 间上'})
+        data = response.get_json()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['added'], [{'character': '颗', 'index': 5},
+                                         {'character': '一', 'index': 6},
+                                         {'character': '间', 'index': 7}])
+        self.assertEqual(data['existing'], [{'character': '上', 'index': 0}])
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), '上下边毛中颗一间')
+    
+    def test_bulk_add_without_chinese(self):
+        """Text without Chinese characters is rejected"""
+        response = self.client.post('/add-characters', json={'text': 'abc 123'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_bulk_add_rejects_malformed_json(self):
+        """Non-object bodies and non-string text are 400s, not 500s"""
+        for body in (['上颗'], {'text': ['颗']}, {'text': 5}):
+            with self.subTest(body=body):
+                response = self.client.post('/add-characters', json=body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), '上下边毛中')
+    
+    def test_single_add_reports_duplicates(self):
+        """/add-character still rejects characters already in the database"""
+        response = self.client.post('/add-character', json={'character': '颗'})
+        self.assertEqual(response.get_json()['index'], 5)
+        response = self.client.post('/add-character', json={'character': '颗'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,47 @@
+import unittest
+import sys
+import os
+import random
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import filter_chinese_characters
+
+
+class TestFilterChineseCharacters(unittest.TestCase):
+    
+    def test_order_and_dedupe(self):
+        """Unique characters in order of first appearance, astral planes included"""
+        text = 'abc 上下，上 𠀀 hello 下中𠀀！'
+        self.assertEqual(filter_chinese_characters(text), '上下𠀀中')
+    
+    def test_chunks_and_limit(self):
+        """Chunked input matches whole input; limit keeps the first N"""
+        text = ''.join(chr(0x4E00 + i % 300) + ' ' for i in range(5000))
+        expected = ''.join(chr(0x4E00 + i) for i in range(300))
+        self.assertEqual(filter_chinese_characters(text, chunk_size=7), expected)
+        self.assertEqual(filter_chinese_characters([text[:999], text[999:]]), expected)
+        self.assertEqual(filter_chinese_characters(text, limit=10, chunk_size=64), expected[:10])
+    
+    def test_many_unique_characters(self):
+        """Dense runs of new characters and sparse repeats keep first-appearance order"""
+        rng = random.Random(4)
+        dense = [chr(0x4E00 + i) for i in range(3000)]
+        rng.shuffle(dense)
+        sparse = [rng.choice(dense[:50]) + rng.choice('，a ') for _ in range(2000)]
+        text = ''.join(dense[:1500]) + ''.join(sparse) + '龍𠀀' + ''.join(dense)
+        expected = ''.join(dict.fromkeys(char for char in text if char not in '，a '))
+        for chunk_size in (64, 1000, 1 << 16):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(filter_chinese_characters(text, chunk_size=chunk_size), expected)
+                self.assertEqual(filter_chinese_characters(text, limit=2000, chunk_size=chunk_size),
+                                 expected[:2000])
+    
+    def test_custom_ranges(self):
+        """Only the configured ranges are kept"""
+        self.assertEqual(filter_chinese_characters('上𠀀か', ranges=((0x3040, 0x309F),)), 'か')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
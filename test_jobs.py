@@ -0,0 +1,135 @@
+import unittest
+import sys
+import os
+import json
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import JobQueue
+
+
+class TestJobQueue(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.original_queue = app.job_queue
+        app.job_queue = self.queue = self.make_queue()
+        self.client = app.app.test_client()
+    
+    def tearDown(self):
+        self.queue.shutdown()
+        app.job_queue = self.original_queue
+        self.tmp.cleanup()
+    
+    def make_queue(self, **kwargs):
+        return JobQueue(os.path.join(self.tmp.name, 'jobs.sqlite3'), self.tmp.name, workers=1, **kwargs)
+    
+    def wait_for(self, job_id, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = self.client.get(f'/jobs/{job_id}').get_json()
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep(0.05)
+        self.fail(f"Job {job_id} did not finish")
+    
+    def test_custom_job(self):
+        """A submitted job renders the same PDF as the synchronous route"""
+        form = {'kind': 'custom', 'custom_chars': '上下边毛中', 'shuffle': 'on', 'seed': '5'}
+        submitted = self.client.post('/jobs', data=form)
+        self.assertEqual(submitted.status_code, 202)
+        self.assertEqual(submitted.headers['X-Seed'], '5')
+        
+        job = self.wait_for(submitted.get_json()['id'])
+        self.assertEqual(job['status'], 'done')
+        download = self.client.get(job['download_url'])
+        self.assertEqual(download.mimetype, 'application/pdf')
+        
+        app.pdf_result_cache.clear()
+        direct = self.client.post('/generate-custom', data=form)
+        self.assertEqual(download.data, direct.data)
+    
+    def test_download_missing_result(self):
+        """A finished job whose PDF was removed is a 410, not a 500"""
+        submitted = self.client.post('/jobs', data={'kind': 'custom', 'custom_chars': '上下', 'seed': '1'})
+        job = self.wait_for(submitted.get_json()['id'])
+        os.remove(self.queue.result_path(job['id']))
+        
+        response = self.client.get(job['download_url'])
+        self.assertEqual(response.status_code, 410)
+        self.assertIn('error', response.get_json())
+    
+    def test_math_job_pins_seed(self):
+        """Jobs without a seed get one at submit time"""
+        submitted = self.client.post('/jobs', data={'kind': 'math', 'num_problems': '6', 'output_mode': 'vector'})
+        job = self.wait_for(submitted.get_json()['id'])
+        self.assertEqual(job['status'], 'done')
+        self.assertIn('6problems', job['filename'])
+        with sqlite3.connect(self.queue.db_path) as conn:
+            params = json.loads(conn.execute("SELECT params FROM jobs").fetchone()[0])
+        self.assertEqual(params['seed'], submitted.headers['X-Seed'])
+    
+    def test_errors(self):
+        """Invalid submissions are rejected up front; unknown jobs are 404"""
+        self.assertEqual(self.client.post('/jobs', data={'kind': 'custom', 'custom_chars': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.post('/jobs', data={'kind': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/jobs/missing').status_code, 404)
+        self.assertEqual(self.client.get('/jobs/missing/download').status_code, 404)
+    
+    def test_math_problem_count_is_bounded(self):
+        """Out-of-range or non-numeric problem counts are 400s on both math routes"""
+        for value in ('0', str(app.MAX_MATH_PROBLEMS + 1), '10000000', 'many'):
+            with self.subTest(num_problems=value):
+                submitted = self.client.post('/jobs', data={'kind': 'math', 'num_problems': value})
+                self.assertEqual(submitted.status_code, 400)
+                self.assertIn('error', submitted.get_json())
+                direct = self.client.post('/generate-math', data={'num_problems': value})
+                self.assertEqual(direct.status_code, 400)
+    
+    def test_restart_resumes_jobs(self):
+        """Jobs left running by a dead process are rendered after a restart"""
+        self.queue._ensure_started()
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        params = json.dumps({'custom_chars': '上下', 'seed': '1'})
+        with sqlite3.connect(self.queue.db_path) as conn:
+            conn.execute("INSERT INTO jobs (id, kind, params, status, pid, created_at, claimed_at)"
+                         " VALUES ('stale', 'custom', ?, 'running', ?, ?, ?)",
+                         (params, dead.pid, time.time(), time.time()))
+        
+        self.queue.shutdown()
+        app.job_queue = self.queue = self.make_queue()
+        self.assertEqual(self.wait_for('stale')['status'], 'done')
+    
+    def test_polling_requeues_stale_claims(self):
+        """Dead or timed-out claims are requeued while the queue runs, not just at startup"""
+        self.queue.shutdown()
+        app.job_queue = self.queue = self.make_queue(recover_interval=0)
+        self.queue._ensure_started()
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        params = json.dumps({'custom_chars': '上下', 'seed': '1'})
+        with sqlite3.connect(self.queue.db_path) as conn:
+            conn.execute("INSERT INTO jobs (id, kind, params, status, pid, created_at, claimed_at)"
+                         " VALUES ('dead', 'custom', ?, 'running', ?, ?, ?)",
+                         (params, dead.pid, time.time(), time.time()))
+            conn.execute("INSERT INTO jobs (id, kind, params, status, pid, created_at, claimed_at)"
+                         " VALUES ('hung', 'custom', ?, 'running', ?, ?, ?)",
+                         (params, os.getpid(), time.time(), time.time() - self.queue.stale_after - 1))
+            conn.execute("INSERT INTO jobs (id, kind, params, status, pid, created_at, claimed_at)"
+                         " VALUES ('busy', 'custom', ?, 'running', ?, ?, ?)",
+                         (params, os.getpid(), time.time(), time.time()))
+        
+        self.assertEqual(self.wait_for('dead')['status'], 'done')
+        self.assertEqual(self.wait_for('hung')['status'], 'done')
+        self.assertEqual(self.queue.get('busy')['status'], 'running')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
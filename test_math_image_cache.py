@@ -0,0 +1,73 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import MathImageCache, render_math_png, LATEX_AVAILABLE
+
+
+class TestMathImageCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+    
+    def test_lru_eviction(self):
+        """Least recently used entries are evicted first"""
+        cache = MathImageCache(max_entries=2)
+        cache.put('a', b'1')
+        cache.put('b', b'2')
+        cache.get('a')
+        cache.put('c', b'3')
+        
+        self.assertEqual(cache.get('a'), b'1')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), b'3')
+        self.assertEqual(cache.stats()['entries'], 2)
+    
+    def test_hit_miss_counters(self):
+        """Hits and misses are counted"""
+        cache = MathImageCache()
+        self.assertIsNone(cache.get('x'))
+        cache.put('x', b'png')
+        cache.get('x')
+        cache.get('x')
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+    
+    def test_disk_tier(self):
+        """Entries survive in cache_dir across cache instances"""
+        key = ('2^{3}', 18, 300, True)
+        MathImageCache(cache_dir=self.cache_dir).put(key, b'png-bytes')
+        
+        fresh = MathImageCache(cache_dir=self.cache_dir)
+        self.assertEqual(fresh.get(key), b'png-bytes')
+        self.assertEqual(fresh.stats()['disk_hits'], 1)
+        self.assertEqual(fresh.stats()['misses'], 0)
+    
+    @unittest.skipUnless(LATEX_AVAILABLE, "matplotlib not installed")
+    def test_render_math_png_uses_cache(self):
+        """Repeat expressions are served from the cache"""
+        original = app.math_image_cache
+        app.math_image_cache = MathImageCache()
+        try:
+            first = render_math_png('2^{3} × 2^{4}')
+            second = render_math_png('2^{3} × 2^{4}')
+            self.assertIs(first, second)
+            self.assertTrue(first.startswith(b'\x89PNG'))
+            self.assertEqual(app.math_image_cache.stats()['hits'], 1)
+            self.assertEqual(app.math_image_cache.stats()['misses'], 1)
+        finally:
+            app.math_image_cache = original
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,124 @@
+import unittest
+import sys
+import os
+import random
+import subprocess
+import gc
+import tempfile
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import (generate_exponential_problem, generate_math_pdf,
+                 math_vector_layout, prerender_math_expressions,
+                 CharacterStore, MathImageCache, LATEX_AVAILABLE)
+
+
+@unittest.skipUnless(LATEX_AVAILABLE, "matplotlib not installed")
+class TestMathPdf(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(42)
+        self.problems = [generate_exponential_problem('hard') for _ in range(12)]
+
+    def read_pdf(self, output_mode):
+        with generate_math_pdf(self.problems, len(self.problems), output_mode) as f:
+            return f.read()
+
+    def test_vector_mode_embeds_no_images(self):
+        """Vector mode draws glyph forms instead of PNG images"""
+        raster = self.read_pdf('raster')
+        vector = self.read_pdf('vector')
+
+        self.assertIn(b'/Subtype /Image', raster)
+        self.assertNotIn(b'/Subtype /Image', vector)
+        self.assertLess(len(vector), len(raster))
+
+    def test_vector_layout(self):
+        """Layouts have glyphs and a fraction rule where expected"""
+        glyphs, rules, (x0, y0, x1, y1) = math_vector_layout('(1/2)^{4} × 2^{8}')
+        self.assertTrue(glyphs)
+        self.assertEqual(len(rules), 1)
+        # Form writers look outlines up by form name
+        self.assertTrue(all(name in app._math_form_outlines for name, _, _, _ in glyphs))
+        self.assertGreater(x1 - x0, 0)
+        self.assertGreater(y1 - y0, 0)
+
+
+    def prerender(self, workers):
+        original = (app.math_image_cache, app.MATH_RENDER_WORKERS)
+        app.math_image_cache = MathImageCache()
+        app.MATH_RENDER_WORKERS = workers
+        try:
+            return prerender_math_expressions(self.problems)
+        finally:
+            app.math_image_cache, app.MATH_RENDER_WORKERS = original
+
+    def test_prerender_serial(self):
+        """Every question and answer is rendered once in the batch"""
+        rendered = self.prerender(0)
+        self.assertLessEqual(len(rendered), 2 * len(self.problems))
+        self.assertTrue(all(png.startswith(b'\x89PNG') for png in rendered.values()))
+
+    def test_prerender_pool_matches_serial(self):
+        """The process pool produces the same images as the serial path"""
+        try:
+            self.assertEqual(self.prerender(2), self.prerender(0))
+        finally:
+            app._reset_math_render_pool()
+
+
+class TestLazyMathStack(unittest.TestCase):
+
+    def test_import_leaves_math_stack_unloaded(self):
+        """Importing the app does not pull in matplotlib or numpy"""
+        code = ('import sys, app; '
+                'print(sorted(name for name in ("matplotlib", "numpy") if name in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
+    @unittest.skipUnless(LATEX_AVAILABLE, "matplotlib not installed")
+    def test_load_math_stack(self):
+        """The loader makes the renderer globals available"""
+        self.assertTrue(app.load_math_stack())
+        self.assertIn('matplotlib', sys.modules)
+        self.assertIsNotNone(app.render_math_latex('2^{3}'))
+
+
+class TestWarmUp(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('一二三四五六七八九十')
+        self.original = (app.character_store, app.math_image_cache)
+        app.character_store = CharacterStore(self.path, compiled=False)
+        app.math_image_cache = MathImageCache()
+
+    def tearDown(self):
+        gc.unfreeze()
+        app.character_store, app.math_image_cache = self.original
+        os.unlink(self.path)
+
+    def test_sheets_only(self):
+        """Without math, only the character index and font are prepared"""
+        timings = app.warm_up(math=False)
+        self.assertEqual(set(timings), {'characters', 'fonts'})
+        self.assertIsNotNone(app.character_store._chars)
+        self.assertIsNotNone(app.cjk_fonts.font_name)
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+    @unittest.skipUnless(LATEX_AVAILABLE, "matplotlib not installed")
+    def test_math_expressions_cached_without_pool(self):
+        """Math warm-up fills the caches serially and starts no render pool"""
+        app._reset_math_render_pool()
+        timings = app.warm_up(math_problems=2)
+        self.assertIn('math', timings)
+        self.assertGreater(app.math_image_cache.stats()['entries'], 0)
+        self.assertIsNone(app._math_render_pool)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
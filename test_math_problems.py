@@ -0,0 +1,71 @@
+import unittest
+import sys
+import os
+import random
+import re
+from collections import Counter
+from fractions import Fraction
+from unittest import mock
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import NUMPY_AVAILABLE, generate_exponential_problem, generate_exponential_problems
+
+
+def evaluate(expression):
+    """Exact value of a problem or answer string"""
+    python = re.sub(r'(\d+)', r'Fraction(\1)', expression)
+    python = python.replace('^{', '**(').replace('}', ')').replace('×', '*').replace('÷', '/')
+    return eval(python, {'Fraction': Fraction})
+
+
+def shape(problem):
+    return re.sub(r'-?\d+', 'n', problem)
+
+
+class TestBatchProblemGenerator(unittest.TestCase):
+    
+    def test_answers_are_correct(self):
+        """Every batch answer equals its problem"""
+        for difficulty in ('easy', 'medium', 'hard'):
+            for problem, answer in generate_exponential_problems(difficulty, 2000, random.Random(3)):
+                self.assertEqual(evaluate(problem), evaluate(answer), (problem, answer))
+    
+    def test_seeded(self):
+        """The same request Random gives the same batch"""
+        first = generate_exponential_problems('hard', 50, random.Random(11))
+        self.assertEqual(first, generate_exponential_problems('hard', 50, random.Random(11)))
+        self.assertEqual(len(first), 50)
+        self.assertEqual(generate_exponential_problems('easy', 0, random.Random(11)), [])
+    
+    @unittest.skipUnless(NUMPY_AVAILABLE, "NumPy not available")
+    def test_batch_path_needs_only_numpy(self):
+        """The NumPy path runs without loading matplotlib or PIL"""
+        with mock.patch.object(app, 'load_math_stack', side_effect=AssertionError("math stack loaded")), \
+             mock.patch.object(app, 'generate_exponential_problem', side_effect=AssertionError("scalar fallback")):
+            self.assertEqual(len(generate_exponential_problems('hard', 20, random.Random(2))), 20)
+    
+    @unittest.skipUnless(NUMPY_AVAILABLE, "NumPy not available")
+    def test_same_distribution_as_scalar(self):
+        """Problem shapes and numbers match the one-at-a-time generator"""
+        count = 20000
+        for difficulty in ('easy', 'medium', 'hard'):
+            batch = generate_exponential_problems(difficulty, count, random.Random(5))
+            rng = random.Random(5)
+            scalar = [generate_exponential_problem(difficulty, rng) for _ in range(count)]
+            
+            batch_shapes = Counter(shape(problem) for problem, _ in batch)
+            scalar_shapes = Counter(shape(problem) for problem, _ in scalar)
+            self.assertEqual(set(batch_shapes), set(scalar_shapes))
+            for key in scalar_shapes:
+                self.assertAlmostEqual(batch_shapes[key] / count, scalar_shapes[key] / count, delta=0.02)
+            
+            batch_numbers = {n for problem, _ in batch for n in re.findall(r'-?\d+', problem)}
+            scalar_numbers = {n for problem, _ in scalar for n in re.findall(r'-?\d+', problem)}
+            self.assertEqual(batch_numbers, scalar_numbers)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
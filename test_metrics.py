@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    
+    def test_histogram_exposition(self):
+        """Histogram buckets are cumulative and end with +Inf, _sum and _count"""
+        registry = Metrics()
+        registry.describe('latency_seconds', 'histogram', 'Latency')
+        for seconds in (0.001, 0.02, 0.02, 60):
+            registry.observe('latency_seconds', seconds, route='a')
+        lines = registry.render().splitlines()
+        
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{route="a",le="0.005"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="a",le="0.025"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="a",le="30.0"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="a",le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_count{route="a"} 4', lines)
+    
+    def test_counter_labels_are_escaped(self):
+        """Label values are escaped per the text format"""
+        registry = Metrics()
+        registry.inc('events_total', name='say "hi"\n')
+        registry.inc('events_total', 2, name='say "hi"\n')
+        self.assertIn('events_total{name="say \\"hi\\"\\n"} 3', registry.render())
+    
+    def test_route_label(self):
+        """Spans outside a request use the route_label override"""
+        registry = Metrics()
+        with registry.route_label('job_custom'):
+            with registry.span('draw'):
+                pass
+        self.assertIn('stage_duration_seconds_count{route="job_custom",stage="draw"} 1', registry.render())
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    
+    def setUp(self):
+        self.client = app.app.test_client()
+        app.pdf_result_cache.clear()
+    
+    def test_stage_and_route_metrics(self):
+        """A generation request records its stages, route latency and cache state"""
+        self.client.post('/generate-custom', data={'custom_chars': '上下边毛中', 'seed': '1'})
+        response = self.client.get('/metrics')
+        self.assertEqual(response.mimetype, 'text/plain')
+        text = response.get_data(as_text=True)
+        
+        for stage in ('select', 'draw', 'save'):
+            self.assertIn(f'stage_duration_seconds_count{{route="generate_custom",stage="{stage}"}}', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="POST",route="generate_custom",le="+Inf"}', text)
+        self.assertIn('http_requests_total{method="POST",route="generate_custom",status="200"}', text)
+        self.assertIn('pdf_result_cache_requests_total{result="miss"}', text)
+        self.assertIn('cjk_font_fallback_active', text)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
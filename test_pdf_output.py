@@ -0,0 +1,266 @@
+import unittest
+import sys
+import os
+import random
+from importlib.util import find_spec
+from io import BytesIO
+from reportlab.pdfgen import canvas
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import (generate_pdf, generate_tracing_pdf, draw_character_sheet, draw_tracing_sheet, glyph_outline,
+                 pdf_spill_stats, FontRegistry, PdfResultCache, LATEX_AVAILABLE)
+
+# Any TrueType font exercises the embedded mode; matplotlib ships one
+_matplotlib = find_spec('matplotlib')
+TTF_PATH = _matplotlib and os.path.join(os.path.dirname(_matplotlib.origin), 'mpl-data', 'fonts', 'ttf', 'DejaVuSans.ttf')
+
+
+class TestPdfOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.app.test_client()
+        self.threshold = app.PDF_SPILL_THRESHOLD
+
+    def tearDown(self):
+        app.PDF_SPILL_THRESHOLD = self.threshold
+
+    def test_small_pdf_stays_in_memory(self):
+        """PDFs under the threshold are returned as an in-memory buffer"""
+        pdf_file = generate_pdf(list('上下边毛中'))
+        self.assertIsInstance(pdf_file, BytesIO)
+        self.assertTrue(pdf_file.read(5).startswith(b'%PDF'))
+
+    def test_large_pdf_spills_to_disk(self):
+        """PDFs over the threshold are moved to an anonymous temp file"""
+        app.PDF_SPILL_THRESHOLD = 0
+        files_before = pdf_spill_stats['files']
+        bytes_before = pdf_spill_stats['bytes']
+
+        with generate_pdf(list('上下边毛中')) as pdf_file:
+            self.assertNotIsInstance(pdf_file, BytesIO)
+            data = pdf_file.read()
+
+        self.assertTrue(data.startswith(b'%PDF'))
+        self.assertEqual(pdf_spill_stats['files'], files_before + 1)
+        self.assertEqual(pdf_spill_stats['bytes'], bytes_before + len(data))
+
+    def test_route_sends_pdf(self):
+        """/generate-custom serves the buffer with a Content-Length"""
+        for threshold in (self.threshold, 0):
+            app.PDF_SPILL_THRESHOLD = threshold
+            response = self.client.post('/generate-custom', data={'custom_chars': '你好世界'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/pdf')
+            self.assertEqual(response.content_length, len(response.data))
+            self.assertTrue(response.data.startswith(b'%PDF'))
+            response.close()
+
+
+class TestCharacterSheetContent(unittest.TestCase):
+
+    def draw(self, *sheets):
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pageCompression=0)
+        for n, characters in enumerate(sheets):
+            if n:
+                c.showPage()
+            draw_character_sheet(c, characters)
+        c.save()
+        return buffer.getvalue()
+
+    def test_grid_form_shared_across_pages_and_sheets(self):
+        """The grid is defined once and placed on every full page"""
+        chars = [chr(cp) for cp in range(0x4E00, 0x4E00 + 100)]
+        data = self.draw(chars, chars[:60])
+        self.assertEqual(data.count(b'/Subtype /Form'), 1)
+        self.assertEqual(data.count(b'/FormXob.character-grid Do'), 3)
+        # The partial last page outlines only its 10 filled cells
+        self.assertEqual(data.count(b' re S'), 50 + 10)
+
+    def test_uniform_rows_drawn_as_one_string(self):
+        """Rows of equal-width glyphs are one text operation each"""
+        data = self.draw([chr(cp) for cp in range(0x4E00, 0x4E00 + 50)])
+        self.assertEqual(data.count(b') Tj'), 10)
+
+        mixed = self.draw(list('中a') + [chr(cp) for cp in range(0x4E00, 0x4E00 + 48)])
+        self.assertEqual(mixed.count(b') Tj'), 5 + 9)
+
+
+class TestFontRegistry(unittest.TestCase):
+
+    def test_resolves_first_working_font(self):
+        """The first CID font that registers is used"""
+        fonts = FontRegistry(candidates=('No-Such-Font', 'STSong-Light'))
+        self.assertEqual(fonts.resolve(), 'STSong-Light')
+        self.assertFalse(fonts.fallback_active)
+        self.assertIn('No-Such-Font', fonts.status()['errors'])
+
+    def test_helvetica_fallback(self):
+        """Helvetica is reported when no CJK font registers"""
+        fonts = FontRegistry(candidates=('No-Such-Font',))
+        self.assertEqual(fonts.resolve(), 'Helvetica')
+        self.assertTrue(fonts.status()['fallback_active'])
+
+    def test_char_width_cached(self):
+        """Widths scale with font size and are cached per character"""
+        fonts = FontRegistry()
+        self.assertAlmostEqual(fonts.char_width('中', 32), 2 * fonts.char_width('中', 16))
+        self.assertIn('中', fonts._widths)
+
+    def test_unloadable_ttf_falls_back_to_cid(self):
+        """A broken CJK_FONT_PATH is reported and the CID font is used"""
+        fonts = FontRegistry(ttf_path='/no/such/font.ttf')
+        self.assertEqual(fonts.resolve(), 'STSong-Light')
+        self.assertFalse(fonts.status()['embedded'])
+        self.assertIn('/no/such/font.ttf', fonts.status()['errors'])
+
+
+@unittest.skipUnless(TTF_PATH and os.path.exists(TTF_PATH), "no TrueType font available")
+class TestEmbeddedFont(unittest.TestCase):
+
+    def setUp(self):
+        self.original = app.cjk_fonts
+        app.cjk_fonts = FontRegistry(ttf_path=TTF_PATH)
+
+    def tearDown(self):
+        app.cjk_fonts = self.original
+
+    def render(self, characters):
+        with generate_pdf(characters) as pdf_file:
+            return pdf_file.read()
+
+    def test_embeds_subset(self):
+        """The font program is embedded as a subset far smaller than the file"""
+        self.assertEqual(app.cjk_fonts.resolve(), 'DejaVuSans')
+        data = self.render(list('ABCDEFGHIJ'))
+        self.assertIn(b'/FontFile2', data)
+        self.assertNotIn(b'STSong-Light', data)
+        self.assertLess(len(data), os.path.getsize(TTF_PATH) / 10)
+        self.assertTrue(app.cjk_fonts.status()['embedded'])
+
+    def test_subsets_cached_by_character_set(self):
+        """The same characters in another order reuse the built subsets"""
+        def counts():
+            stats = app.cjk_fonts.status()['subset_cache']
+            return stats['hits'], stats['misses']
+
+        chars = [chr(cp) for cp in range(0x100, 0x100 + 300)]
+        hits, misses = counts()
+        first = self.render(chars)
+        built = counts()[1] - misses
+        self.assertGreater(built, 1)
+        self.assertEqual(counts()[0], hits)
+
+        random.Random(1).shuffle(chars)
+        self.render(chars)
+        self.assertEqual(counts(), (hits + built, misses + built))
+        self.assertEqual(self.render(sorted(chars)), first)
+
+
+class TestTracingSheets(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.app.test_client()
+        self.original = app.cjk_fonts
+
+    def tearDown(self):
+        app.cjk_fonts = self.original
+
+    def render(self, characters):
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pageCompression=0)
+        draw_tracing_sheet(c, characters)
+        c.save()
+        return buffer.getvalue()
+
+    @unittest.skipUnless(LATEX_AVAILABLE and TTF_PATH and os.path.exists(TTF_PATH), "no outline font available")
+    def test_outlines_extracted_once_per_character(self):
+        """Every cell places a shared glyph form; outlines are extracted per unique character"""
+        app.cjk_fonts = FontRegistry(ttf_path=TTF_PATH)
+        glyph_outline.cache_clear()
+        chars = list('ABCDEFGHIJ') * 2
+        data = self.render(chars)
+
+        self.assertEqual(glyph_outline.cache_info().misses, 10)
+        self.assertEqual(data.count(b'/Subtype /Form'), 10 + 1)  # glyphs and the row grid
+        self.assertEqual(data.count(b'/FormXob.TraceGlyph41 Do'), 2 * (app.TRACE_COPIES + 1))
+        self.assertEqual(data.count(b'/FormXob.tracing-row-6 Do'), 20)
+
+    def test_text_without_outline_font(self):
+        """With the CID font the tracing rows are drawn as text"""
+        with generate_tracing_pdf(list('一二三四五六七八九十')) as pdf_file:
+            data = pdf_file.read()
+        self.assertNotIn(b'TraceGlyph', data)
+        self.assertTrue(data.startswith(b'%PDF'))
+
+    def test_route_sheet_style(self):
+        """/generate-custom renders tracing rows when asked, cached separately from the grid"""
+        grid = self.client.post('/generate-custom', data={'custom_chars': '你好世界'})
+        tracing = self.client.post('/generate-custom', data={'custom_chars': '你好世界', 'sheet_style': 'tracing'})
+        self.assertEqual(tracing.status_code, 200)
+        self.assertIn(b'tracing-row-6', tracing.data)
+        self.assertNotEqual(grid.get_etag()[0], tracing.get_etag()[0])
+
+        unknown = self.client.post('/generate-custom', data={'custom_chars': '你好世界', 'sheet_style': 'bogus'})
+        self.assertEqual(unknown.get_etag()[0], grid.get_etag()[0])
+
+
+class TestPdfResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app.app.test_client()
+        app.pdf_result_cache.clear()
+
+    def test_size_bounded_eviction(self):
+        """Oldest entries are evicted once max_bytes is exceeded"""
+        cache = PdfResultCache(max_bytes=10, max_entry_bytes=10)
+        cache.put('a', b'12345')
+        cache.put('b', b'12345')
+        cache.put('c', b'12345')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), b'12345')
+        self.assertEqual(cache.stats()['bytes'], 10)
+
+        cache.put('big', b'x' * 11)
+        self.assertIsNone(cache.get('big'))
+
+    def test_identical_requests_share_etag(self):
+        """Unshuffled repeats are served from the cache with the same strong ETag"""
+        first = self.client.post('/generate-custom', data={'custom_chars': '你好世界'})
+        second = self.client.post('/generate-custom', data={'custom_chars': '你好世界'})
+
+        etag, weak = first.get_etag()
+        self.assertTrue(etag)
+        self.assertFalse(weak)
+        self.assertEqual(second.get_etag()[0], etag)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(app.pdf_result_cache.stats()['hits'], 1)
+
+    def test_unseeded_shuffle_is_not_cached(self):
+        """Shuffled requests are only stored when the client supplied the seed"""
+        self.client.post('/generate-custom', data={'custom_chars': '你好世界', 'shuffle': 'on'})
+        self.assertEqual(app.pdf_result_cache.stats()['entries'], 0)
+
+        data = {'custom_chars': '你好世界', 'shuffle': 'on', 'seed': '7'}
+        first = self.client.post('/generate-custom', data=data)
+        second = self.client.post('/generate-custom', data=data)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(app.pdf_result_cache.stats()['hits'], 1)
+
+    def test_if_none_match_on_post_returns_412(self):
+        """A matching If-None-Match on a POST skips rendering with 412 (RFC 7232 3.2)"""
+        first = self.client.post('/generate-custom', data={'custom_chars': '你好世界'})
+        etag = first.get_etag()[0]
+
+        response = self.client.post('/generate-custom', data={'custom_chars': '你好世界'},
+                                    headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(app.pdf_result_cache.stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,61 @@
+import unittest
+import sys
+import os
+import random
+
+# Add the parent directory to sys.path to import app functions
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app
+from app import generate_exponential_problem, request_rng
+
+
+class TestSeededGeneration(unittest.TestCase):
+    
+    def setUp(self):
+        self.client = app.app.test_client()
+        app.pdf_result_cache.clear()
+    
+    def test_same_seed_same_problems(self):
+        """A per-request Random reproduces the same problems"""
+        for difficulty in ('easy', 'medium', 'hard'):
+            first = [generate_exponential_problem(difficulty, random.Random(7)) for _ in range(20)]
+            second = [generate_exponential_problem(difficulty, random.Random(7)) for _ in range(20)]
+            self.assertEqual(first, second)
+    
+    def test_request_rng(self):
+        """Seeds are parsed, generated when missing, and validated"""
+        seed, rng = request_rng('123')
+        self.assertEqual(seed, 123)
+        self.assertEqual(rng.random(), random.Random(123).random())
+        
+        seed, _ = request_rng('')
+        self.assertIsInstance(seed, int)
+        
+        with self.assertRaises(ValueError):
+            request_rng('abc')
+    
+    def test_seed_echoed_and_reproducible(self):
+        """Shuffled requests with the same seed return the same cached PDF"""
+        data = {'custom_chars': '你好世界上下边毛中', 'shuffle': 'on', 'seed': '42'}
+        first = self.client.post('/generate-custom', data=data)
+        second = self.client.post('/generate-custom', data=data)
+        
+        self.assertEqual(first.headers['X-Seed'], '42')
+        self.assertEqual(first.get_etag(), second.get_etag())
+        self.assertEqual(app.pdf_result_cache.stats()['hits'], 1)
+    
+    def test_math_seed(self):
+        """Math worksheets with the same seed are identical"""
+        data = {'difficulty': 'hard', 'num_problems': '6', 'seed': '5'}
+        first = self.client.post('/generate-math', data=data)
+        second = self.client.post('/generate-math', data=data)
+        self.assertEqual(first.headers['X-Seed'], '5')
+        self.assertEqual(first.data, second.data)
+        
+        unseeded = self.client.post('/generate-math', data={'num_problems': '6'})
+        self.assertTrue(unseeded.headers['X-Seed'].isdigit())
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -18,5 +18,15 @@ if project_home not in sys.path:
 # Import your Flask application
 from app import app as application
 
+# Optionally build the character index, fonts and math renderer caches
+# before the server forks its workers, so they are shared copy-on-write.
+# Only useful when the app is loaded in the master (gunicorn --preload,
+# uWSGI without lazy-apps). WARM_UP=1 warms everything, WARM_UP=sheets
+# skips the math renderer
+warm_up_mode = os.environ.get('WARM_UP', '0')
+if warm_up_mode != '0':
+    from app import warm_up
+    warm_up(math=warm_up_mode != 'sheets')
+
 if __name__ == "__main__":
     application.run()
\ No newline at end of file